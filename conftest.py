@@ -0,0 +1,13 @@
+import pytest
+
+from lib.synthetic import Corpus
+
+
+@pytest.fixture(scope='session')
+def synthetic_corpus(tmp_path_factory):
+    """
+    A synthetic PMED text, including all lines fixed in `lib.lines`.
+    """
+    p = tmp_path_factory.mktemp('corpus') / 'pmed.txt'
+    Corpus(scale=1, seed=1).write(p)
+    return p
@@ -1,6 +1,6 @@
+import os
 import collections
 import pathlib
-import subprocess
 import dataclasses
 
 import pylexibank
@@ -9,7 +9,11 @@ from clldutils.path import ensure_cmd
 from clldutils.misc import slug
 from csvw.dsv import UnicodeWriter
 
-from lib.parser import Dictionary, Gloss
+from lib.parser import Gloss
+from lib.cache import ParseCache
+from lib.metrics import METRICS
+from lib.pdftext import pdf_to_text
+from lib.streaming import spool_tables
 
 # Customize your basic data.
 # if you need to store other data in columns than the lexibank defaults, then over-ride
@@ -37,143 +41,188 @@ class Dataset(BaseDataset):
         strip_inside_brackets=True   # do you want data removed in brackets or not?
     )
 
+    # If set, rows of FormTable, CognateTable and CognatesetTable are spooled to disk as they are
+    # added, rather than kept in memory until the CLDF writer exits.
+    streaming = bool(os.environ.get('PMED_STREAMING'))
+
     def cmd_download(self, args):
+        # A local copy of the PDF in raw/ is used if present, otherwise the PDF is downloaded.
+        if (self.raw_dir / 'pmed.pdf').exists():
+            self._pdf_to_text(args, self.raw_dir / 'pmed.pdf')
+            return
         with self.raw_dir.temp_download(
                 'http://www.famsi.org/reports/01051/pmed.pdf', 'pmed.pdf') as p:
-            subprocess.check_call([
-                ensure_cmd('pdftotext'),
-                '-nopgbrk',
-                '-layout',
-                str(p),
-                str(self.raw_dir / 'pmed.txt')])
+            self._pdf_to_text(args, p)
+
+    def _pdf_to_text(self, args, pdf):
+        # Equivalent to `pdftotext -nopgbrk -layout`, but converting page ranges in parallel and
+        # caching converted pages.
+        pdf_to_text(
+            pdf,
+            self.raw_dir / 'pmed.txt',
+            cache_dir=self.dir / '.cache' / 'pdftext',
+            pdftotext=ensure_cmd('pdftotext'),
+            pdfinfo=ensure_cmd('pdfinfo'),
+            log=args.log)
 
     def cmd_makecldf(self, args):
-        from lib.parser import Protoform, Reflex
-
+        cache = ParseCache(self.dir / '.cache')
+        with METRICS.timer('parse'):
+            dictionary, hit = cache.load(self.raw_dir / 'pmed.txt')
+        args.log.info('parse cache {}'.format('hit' if hit else 'miss'))
+        if not hit:
+            args.log.info('{} of {} semantic fields re-parsed'.format(
+                cache.fields.misses, cache.fields.hits + cache.fields.misses))
+        METRICS.count('parse_cache.hit' if hit else 'parse_cache.miss')
+        with METRICS.timer('write_dictionary'):
+            self.write_dictionary(args, dictionary)
+        # The optional dependencies pyarrow and numpy are slow to import, so we do so only here.
+        from lib import columnar, matrix
+
+        if os.environ.get('PMED_COLUMNAR'):
+            # A flat table of reflexes and protoforms, for loading with pandas, etc.
+            with METRICS.timer('columnar'):
+                for p in columnar.write(dictionary, os.environ['PMED_COLUMNAR']):
+                    args.log.info('{} written'.format(p))
+        if matrix.numpy:
+            # The statistics reported in the README, computed from the parsed dictionary.
+            with METRICS.timer('statistics'):
+                stats = matrix.PresenceMatrix(
+                    dictionary,
+                    split=lambda form: self.form_spec.split(None, form, lexemes=self.lexemes),
+                ).statistics()
+            args.log.info('\n'.join(['statistics'] + matrix.readme_lines(stats)))
+            for k, v in stats.items():
+                METRICS.set('statistics.' + k, v)
+        if METRICS.path:
+            METRICS.write()
+            args.log.info('metrics written to {}'.format(METRICS.path))
+
+    def write_dictionary(self, args, dictionary):
+        """
+        Write the data of a parsed `lib.parser.Dictionary` with `args.writer`.
+        """
         self.schema(args.writer.cldf, with_cf=False, with_borrowings=False)
         args.writer.cldf.add_columns('CognatesetTable', 'Semantic_Field', 'Semantic_Subfield')
-
-        forms = collections.defaultdict(list)
-        cids = {}
+        if self.streaming:
+            spool_tables(args.writer, 'FormTable', 'CognateTable', 'CognatesetTable')
+
+        # We only keep what's needed to reference forms, i.e. map form keys to (ID, Form) pairs.
+        forms = {}
+        # Concept registry: Each distinct gloss is slugged once, mapping it to a concept ID and
+        # description. Each concept ID is added to the writer once.
+        concepts, cids = {}, set()
+        # Language slugs are computed from the language table up-front, see below.
+        lids, lslugs = {}, set()
+
+        def concept(gloss):
+            if gloss not in concepts:
+                cid = slug(str(gloss or 'nogloss')) or 'nogloss'
+                if cid not in cids:
+                    args.writer.add_concept(ID=cid, Name=str(gloss))
+                    cids.add(cid)
+                concepts[gloss] = (cid, str(gloss or ''))
+            return concepts[gloss]
+
+        def language_id(lang):
+            # Returns `None` for languages not in the language table.
+            if lang not in lids:
+                lid = slug(lang, lowercase=False)
+                lids[lang] = lid if lid in lslugs else None
+            return lids[lang]
 
         def add_form(obj):
-            cid = slug(str(obj.gloss or 'nogloss')) or 'nogloss'
-            if cid not in cids:
-                try:
-                    args.writer.add_concept(ID=cid, Name=str(obj.gloss))
-                except:
-                    print(obj)
-                    raise
+            cid, description = concept(obj.gloss)
             try:
-                return args.writer.add_lexemes(
-                Language_ID=slug(obj.lang, lowercase=False),
+                lexeme = args.writer.add_lexemes(
+                Language_ID=language_id(obj.lang),
                 Parameter_ID=cid,
-                Description=str(obj.gloss or ''),
+                Description=description,
                 Value=obj.form,
                 #Comment=form.comment,
                 #Source=[str(ref) for ref in lang.refs] if lang else [str(ref) for ref in form.gloss.refs],
                 #Doubt=getattr(form, 'doubt', False),
                 )[0]
+                return lexeme['ID'], lexeme['Form']
             except:
                 print(obj)
                 raise
 
         ne = 0
         words = 0
-        sources = collections.Counter()
-        pos = collections.Counter()
         glosses = collections.Counter()
-        dictionary = Dictionary(self.raw_dir / 'pmed.txt')
-        pfs, refl = [], []
-        csid = 0
-        lids = {}
 
         for lang in self.languages:
             del lang['Comment']
             lang['Is_Proto'] = lang.pop('Type') == 'proto language'
             lang['ID'] = slug(lang['ID'], lowercase=False)
             args.writer.add_language(**lang)
-            lids[slug(lang['ID'], lowercase=False)] = 1
-
-        for i in [1, 2]:
-            for sf in dictionary.semantic_fields:
-                assert sf.etyma
-                for e in sf.etyma:
-                    if i == 1:
-                        if e.protoform and e.protoform.form and e.protoform.lang:
-                            pfs.append(e.protoform)
-                            if slug(e.protoform.lang, lowercase=False) not in lids:
-                                assert e.protoform.lang == 'pP+pQp'
-                            else:
-                                fk = (e.protoform.lang, e.protoform.form, str(e.protoform.gloss or ''))
-                                if fk not in forms:
-                                    forms[fk].append(add_form(e.protoform))
-                                else:
-                                    pass  # FIXME: aggregate Source, comment, etc.
-
-                    if i == 2:
-                        fid = None
-                        if e.protoform and e.protoform.form and e.protoform.lang:
-                            fk = (e.protoform.lang, e.protoform.form, str(e.protoform.gloss or ''))
-                            if fk in forms:
-                                fid = forms[fk][0]['ID']
-
-                        csid += 1
-                        args.writer.objects['CognatesetTable'].append(dict(
-                            ID=str(csid),
-                            Name=e.protoform,
-                            Description=str(e.concept),
-                            Comment="\n".join(e.comments),
-                            Semantic_Field=sf.main,
-                            Semantic_Subfield=sf.sub,
-                            Form_ID=fid,
-                        ))
-
-                    ne += 1
-                    #words += len(e.witnesses)
-                    sources.update([w.source for w in e.reflexes if w.source])
-                    pos.update([w.pos for w in e.reflexes if w.pos])
-                    for witness in e.reflexes:
-                        if not witness.form:
-                            continue
-
-                        assert slug(witness.lang, lowercase=False) in lids
-                        fk = (witness.lang, witness.form, str(witness.gloss))
-
-                        if i == 1:
-                            #
-                            # FIXME: if the same word from the same language is listed with
-                            # different glosses, should we just merge the glosses?
-                            # AWA  #meb'a7 aj/s hue*rfano, pobre //              [a]
-                            # AWA  meb'a7       pobre                            [OKMA]
-                            # AWA  meb'a7       hue*rfano                        [OKMA]
-                            #
-                            refl.append(witness)
-                            if fk not in forms:
-                                try:
-                                    forms[fk].append(add_form(witness))
-                                except:
-                                    print(witness.form)
-                                    raise
-                            words += 1
-                            if witness.gloss:
-                                glosses.update([dataclasses.astuple(witness.gloss)])
-                        elif i == 2:
-                            args.writer.add_cognate(
-                                lexeme=forms[fk][0], Cognateset_ID=str(csid), #Doubt=cset.doubt
-                            )
+            lslugs.add(slug(lang['ID'], lowercase=False))
+
+        assert all(sf.etyma for sf in dictionary.semantic_fields)
+        # The etymon ID - as defined by `Dictionary.iter_numbered_etyma` - is the cognate set ID.
+        for csid, sf, e in dictionary.iter_numbered_etyma():
+            # The protoform is added as form before the cognate set referencing it, so the
+            # Form_ID can be resolved right away, without a second pass over all etyma.
+            fid = None
+            if e.protoform and e.protoform.form and e.protoform.lang:
+                if not language_id(e.protoform.lang):
+                    assert e.protoform.lang == 'pP+pQp'
+                else:
+                    fk = (e.protoform.lang, e.protoform.form, e.protoform.gloss or '')
+                    if fk not in forms:
+                        forms[fk] = add_form(e.protoform)
+                    else:
+                        pass  # FIXME: aggregate Source, comment, etc.
+                    fid = forms[fk][0]
+
+            args.writer.objects['CognatesetTable'].append(dict(
+                ID=str(csid),
+                Name=e.protoform,
+                Description=str(e.concept),
+                Comment="\n".join(e.comments),
+                Semantic_Field=sf.main,
+                Semantic_Subfield=sf.sub,
+                Form_ID=fid,
+            ))
+
+            ne += 1
+            #words += len(e.witnesses)
+            for witness in e.reflexes:
+                if not witness.form:
+                    continue
+
+                assert language_id(witness.lang)
+                # Glosses are hashable, so there's no need to stringify them for the key.
+                fk = (witness.lang, witness.form, witness.gloss)
+                #
+                # FIXME: if the same word from the same language is listed with
+                # different glosses, should we just merge the glosses?
+                # AWA  #meb'a7 aj/s hue*rfano, pobre //              [a]
+                # AWA  meb'a7       pobre                            [OKMA]
+                # AWA  meb'a7       hue*rfano                        [OKMA]
+                #
+                if fk not in forms:
+                    try:
+                        forms[fk] = add_form(witness)
+                    except:
+                        print(witness.form)
+                        raise
+                words += 1
+                if witness.gloss:
+                    glosses[witness.gloss] += 1
+                args.writer.add_cognate(
+                    Form_ID=forms[fk][0],
+                    Form=forms[fk][1],
+                    Cognateset_ID=str(csid), #Doubt=cset.doubt
+                )
 
         with UnicodeWriter('glosses.csv') as w:
             w.writerow([f.name for f in dataclasses.fields(Gloss)] + ['count'])
-            for pf, n in sorted(glosses.items(), key=lambda t: (t[0][0] or 'zzz', t[0][1] or 'zzz')):
-                w.writerow(list(pf) + [n])
-        print(ne, words)
-        print(len(forms))
-        #with UnicodeWriter('reflexes.csv') as w:
-        #    w.writerow([f.name for f in dataclasses.fields(Reflex)])
-        #    for pf in refl:
-        #        w.writerow(dataclasses.astuple(pf))
-        #with UnicodeWriter('protoforms.csv') as w:
-        #    w.writerow([f.name for f in dataclasses.fields(Protoform)])
-        #    for pf in pfs:
-        #        w.writerow(dataclasses.astuple(pf))
+            for g, n in sorted(
+                    glosses.items(), key=lambda t: (t[0].spanish or 'zzz', t[0].english or 'zzz')):
+                w.writerow(list(dataclasses.astuple(g)) + [n])
+        args.log.info('{} etyma, {} cognates, {} forms'.format(ne, words, len(forms)))
+        METRICS.count('write_dictionary.cognatesets', ne)
+        METRICS.count('write_dictionary.cognates', words)
+        METRICS.count('write_dictionary.forms', len(forms))
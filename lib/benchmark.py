@@ -0,0 +1,331 @@
+"""
+Benchmarks for the stages of parsing the dictionary and writing the CLDF data.
+
+Each stage is timed separately, with the inputs it consumes computed up-front (and untimed). Results
+are written as JSON and can be compared to a baseline, flagging regressions beyond a threshold.
+
+Usage:
+    python -m lib.benchmark run PMED_TXT [--output RESULTS.json] [--repeat N] [--workers N]
+    python -m lib.benchmark compare BASELINE.json RESULTS.json [--threshold 0.1]
+    python -m lib.benchmark imports [--repeat N]
+
+Everything runs offline. The `write_dictionary` stage requires the CLDF-writing stack (pylexibank
+and friends) and is skipped if it isn't installed.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import functools
+import contextlib
+import statistics
+
+from .lines import (
+    iter_chunks, iter_fixed_blocks, iter_lines_with_pagenumbers, iter_fixed_lines,
+    iter_continued_lines, iter_lines,
+)
+from .parser import Dictionary, SemanticField, iter_etyma
+from .tokenizer import tokenize_reflex, tokenize_protoform
+
+STAGES = {}
+# Budgets for the cumulative import time of modules in milliseconds, as reported by
+# `python -X importtime`. These modules must not import the CLDF-writing stack.
+IMPORT_BUDGETS = {
+    'lib.parser': 150,
+    'lib.cache': 150,
+    'lib.validate': 150,
+    'lib.diff': 150,
+    'lib.sqlite': 150,
+    'lib.service': 250,
+}
+CLDF_STACK = {
+    'csvw', 'clldutils', 'pycldf', 'cldfbench', 'pylexibank', 'pyetymdict', 'numpy', 'pyarrow'}
+
+
+def stage(name):
+    def decorator(func):
+        STAGES[name] = func
+        return func
+    return decorator
+
+
+class Inputs:
+    """
+    Lazily computed inputs of the benchmarked stages.
+    """
+    def __init__(self, p, workers=None):
+        self.p = pathlib.Path(p)
+        self.workers = workers
+
+    @functools.cached_property
+    def fixed_blocks(self):
+        return list(iter_fixed_blocks(iter_chunks(self.p)))
+
+    @functools.cached_property
+    def paged_lines(self):
+        return list(iter_lines_with_pagenumbers(self.fixed_blocks))
+
+    @functools.cached_property
+    def fixed_lines(self):
+        return list(iter_fixed_lines(self.paged_lines))
+
+    @functools.cached_property
+    def lines(self):
+        return list(iter_lines(self.fixed_blocks))
+
+    @functools.cached_property
+    def semantic_fields(self):
+        return list(Dictionary.iter_semantic_fields(self.p))
+
+    @functools.cached_property
+    def entry_lines(self):
+        witnesses, protoforms = [], []
+        for sf in self.semantic_fields:
+            for _, lines in sf.iter_concepts():
+                for _, protoform, lines, _, _, _ in iter_etyma(lines):
+                    if protoform:
+                        protoforms.append(protoform)
+                    for line in lines:
+                        line = line.strip()
+                        if line and not line.startswith('['):
+                            witnesses.append(line)
+        return witnesses, protoforms
+
+    @functools.cached_property
+    def dictionary(self):
+        res = Dictionary(self.p)
+        list(res._iter_etyma())
+        return res
+
+
+@stage('iter_fixed_blocks')
+def _(inputs):
+    return len(list(iter_fixed_blocks(iter_chunks(inputs.p))))
+
+
+@stage('iter_lines_with_pagenumbers')
+def _(inputs):
+    return len(list(iter_lines_with_pagenumbers(inputs.fixed_blocks)))
+
+
+@stage('iter_fixed_lines')
+def _(inputs):
+    return len(list(iter_fixed_lines(inputs.paged_lines)))
+
+
+@stage('iter_continued_lines')
+def _(inputs):
+    return len(list(iter_continued_lines(inputs.fixed_lines)))
+
+
+@stage('iter_lines')
+def _(inputs):
+    return len(list(iter_lines(inputs.fixed_blocks)))
+
+
+@stage('Dictionary._iter_semantic_fields')
+def _(inputs):
+    return len(list(Dictionary._iter_semantic_fields(inputs.lines)))
+
+
+@stage('SemanticField.etyma')
+def _(inputs):
+    return sum(
+        len(SemanticField(sf.main, sf.sub, sf.lines).etyma) for sf in inputs.semantic_fields)
+
+
+@stage('tokenize_reflex')
+def _(inputs):
+    lines = inputs.entry_lines[0]
+    for line in lines:
+        tokenize_reflex(line)
+    return len(lines)
+
+
+@stage('tokenize_protoform')
+def _(inputs):
+    lines = inputs.entry_lines[1]
+    for line in lines:
+        tokenize_protoform(line)
+    return len(lines)
+
+
+@stage('Dictionary(workers=N)')
+def _(inputs):
+    if not inputs.workers:
+        return None
+    return len(list(Dictionary(inputs.p, workers=inputs.workers)._iter_etyma()))
+
+
+@stage('write_dictionary')
+def _(inputs):
+    try:
+        import attr
+        from lexibank_kaufmanpmed import Dataset
+    except ImportError:  # The CLDF-writing stack is not installed.
+        return None
+    import logging
+
+    ds = Dataset()
+    # Write to a temporary directory - which is also used as working directory, to catch other
+    # files written.
+    with tempfile.TemporaryDirectory() as tmp, _chdir(tmp):
+        args = argparse.Namespace(log=logging.getLogger(__name__), dev=False)
+        spec = attr.evolve(ds.cldf_specs(), dir=pathlib.Path(tmp))
+        with ds.cldf_writer(args, cldf_spec=spec) as writer:
+            args.writer = writer
+            ds.write_dictionary(args, inputs.dictionary)
+            return len(writer.objects['FormTable'])
+
+
+@contextlib.contextmanager
+def _chdir(d):
+    cwd = pathlib.Path.cwd()
+    try:
+        os.chdir(d)
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def run(p, repeat=3, stages=None, workers=None, log=None):
+    """
+    :return: `dict` with timings per stage.
+    """
+    inputs = Inputs(p, workers=workers)
+    res = dict(
+        meta=dict(
+            input=str(p),
+            size=inputs.p.stat().st_size,
+            python=platform.python_version(),
+            platform=platform.platform(),
+            repeat=repeat),
+        stages={})
+    for name, func in STAGES.items():
+        if stages and name not in stages:
+            continue
+        times, items = [], None
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            items = func(inputs)
+            times.append(time.perf_counter() - start)
+            if items is None:
+                break
+        if items is None:
+            if log:
+                log.write('{}: skipped\n'.format(name))
+            continue
+        res['stages'][name] = dict(
+            seconds=times,
+            min=min(times),
+            median=statistics.median(times),
+            items=items,
+            per_item_us=min(times) / items * 1e6 if items else None)
+        if log:
+            log.write('{}: {:.4f}s ({} items)\n'.format(name, min(times), items))
+    return res
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    :return: `list` of `(stage, baseline seconds, current seconds, ratio, is_regression)` tuples.
+    """
+    res = []
+    for name, stats in current['stages'].items():
+        if name in baseline['stages']:
+            base = baseline['stages'][name]['min']
+            ratio = stats['min'] / base if base else 1.0
+            res.append((name, base, stats['min'], ratio, ratio > 1 + threshold))
+    return res
+
+
+def import_time(module, repeat=3):
+    """
+    Measure the import time of `module` in fresh interpreters.
+
+    :return: pair (minimal cumulative import time in milliseconds, `set` of top-level packages
+        imported from the CLDF-writing stack).
+    """
+    times, stack = [], set()
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+            cwd=pathlib.Path(__file__).parent.parent,
+            capture_output=True,
+            text=True,
+            check=True)
+        for line in proc.stderr.splitlines():
+            if line.startswith('import time:') and line.count('|') == 2:
+                _, cumulative, name = line.split('|')
+                if not cumulative.strip().isdigit():  # The header line.
+                    continue
+                name = name.strip()
+                if name == module:
+                    times.append(int(cumulative) / 1000)
+                if name.split('.')[0] in CLDF_STACK:
+                    stack.add(name.split('.')[0])
+    return min(times), stack
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the parsing and export stages.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('run')
+    p.add_argument('pmed_txt')
+    p.add_argument('--output', default=None, help='JSON file to write the results to')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--stage', action='append', default=None, choices=list(STAGES))
+    p = subparsers.add_parser('compare')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument(
+        '--threshold', type=float, default=0.1, help='Tolerated relative slowdown per stage')
+    p = subparsers.add_parser('imports', help='Check import times against IMPORT_BUDGETS')
+    p.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(args)
+
+    if args.command == 'imports':
+        failures = 0
+        for module, budget in IMPORT_BUDGETS.items():
+            ms, stack = import_time(module, repeat=args.repeat)
+            failure = ms > budget or stack
+            failures += bool(failure)
+            print('{:<15} {:>7.1f}ms {:>5}ms{}{}'.format(
+                module, ms, budget, '  OVER BUDGET' if ms > budget else '',
+                '  IMPORTS {}'.format(', '.join(sorted(stack))) if stack else ''))
+        return 1 if failures else 0
+
+    if args.command == 'run':
+        res = run(
+            args.pmed_txt,
+            repeat=args.repeat,
+            stages=args.stage,
+            workers=args.workers,
+            log=sys.stderr)
+        if args.output:
+            pathlib.Path(args.output).write_text(json.dumps(res, indent=2), encoding='utf8')
+        else:
+            print(json.dumps(res, indent=2))
+        return 0
+
+    regressions = 0
+    for name, base, cur, ratio, regression in compare(
+            json.loads(pathlib.Path(args.baseline).read_text(encoding='utf8')),
+            json.loads(pathlib.Path(args.current).read_text(encoding='utf8')),
+            threshold=args.threshold):
+        regressions += regression
+        print('{:<35} {:>9.4f}s {:>9.4f}s {:>6.2f}x{}'.format(
+            name, base, cur, ratio, '  REGRESSION' if regression else ''))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
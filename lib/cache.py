@@ -0,0 +1,188 @@
+"""
+A persistent cache for fully parsed `Dictionary` objects.
+
+Cache entries are keyed by a hash of the text of the dictionary and of all sources which
+influence the parsing, i.e. changing either `raw/pmed.txt` or the fix tables and parsing code
+in `lib/` will result in a cache miss.
+
+In case of a miss, the dictionary is re-parsed incrementally: The parsed etyma of each semantic
+field are cached as well, keyed by a hash of the (fixed) lines of the field, so only semantic
+fields whose text changed must be parsed again.
+
+Usage:
+    python -m lib.cache [--clear] CACHE_DIR [PMED_TXT]
+"""
+import pickle
+import hashlib
+import functools
+import pathlib
+import argparse
+
+from .parser import Dictionary
+from .metrics import METRICS
+
+LIB = pathlib.Path(__file__).parent
+SOURCES = [
+    LIB / 'lines.py',
+    LIB / 'parser.py',
+    LIB / 'tokenizer.py',
+    LIB / 'languoids.py',
+    LIB.parent / 'etc' / 'languages.csv',
+]
+# The sources influencing the parsing of the lines of a semantic field into etyma:
+FIELD_SOURCES = [p for p in SOURCES if p.name != 'lines.py']
+
+
+def file_hash(p, hasher=None, bufsize=2 ** 20):
+    hasher = hasher or hashlib.sha256()
+    with pathlib.Path(p).open('rb') as f:
+        for chunk in iter(lambda: f.read(bufsize), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def _dump(obj, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with tmp.open('wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+
+
+class FieldCache:
+    """
+    A persistent cache for the etyma of semantic fields, with one file per field.
+
+    Since pages and line numbers of the lines of a semantic field are hashed relative to the first
+    line, fields are still found in the cache when lines are inserted or removed before them. The
+    page and line numbers of cached etyma are then shifted accordingly.
+    """
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.hits, self.misses = 0, 0
+
+    @functools.cached_property
+    def _sources_digest(self):
+        hasher = hashlib.sha256()
+        for path in FIELD_SOURCES:
+            hasher.update(file_hash(path).digest())
+        return hasher.digest()
+
+    def key(self, sf):
+        hasher = hashlib.sha256(self._sources_digest)
+        hasher.update('{}\t{}\n'.format(sf.main, sf.sub or '').encode('utf8'))
+        page, lineno = _start(sf)
+        for line, p, n in sf.lines:
+            hasher.update('{}\t{}\t{}\n'.format(p - page, n - lineno, line).encode('utf8'))
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return self.directory / '{}.pickle'.format(key)
+
+    def parse(self, dictionary, workers=None):
+        """
+        Prime the `etyma` of the semantic fields of `dictionary` from the cache, parse the fields
+        which were not found, and update the cache.
+        """
+        keys, misses = set(), []
+        for sf in dictionary.semantic_fields:
+            key = self.key(sf)
+            # Identical fields must not share the (mutable) cached etyma.
+            if key not in keys and self._path(key).exists():
+                with self._path(key).open('rb') as f:
+                    (page, lineno), etyma = pickle.load(f)
+                dpage, dlineno = _start(sf)[0] - page, _start(sf)[1] - lineno
+                if dpage or dlineno:
+                    for etymon in etyma:
+                        etymon.page += dpage
+                        etymon.line += dlineno
+                sf.__dict__['etyma'] = etyma
+                METRICS.count_etyma(etyma)
+            else:
+                misses.append((key, sf))
+            keys.add(key)
+
+        if workers and workers > 1 and misses:
+            dictionary._parse_in_parallel(workers, fields=[sf for _, sf in misses])
+        for key, sf in misses:
+            _dump((_start(sf), sf.etyma), self._path(key))
+        # Only the fields of the current text are kept:
+        for p in self.directory.glob('*.pickle'):
+            if p.stem not in keys:
+                p.unlink()
+
+        self.hits, self.misses = len(dictionary.semantic_fields) - len(misses), len(misses)
+        METRICS.count('field_cache.hit', self.hits)
+        METRICS.count('field_cache.miss', self.misses)
+        return dictionary
+
+    def clear(self):
+        if self.directory.exists():
+            for p in self.directory.glob('*.pickle'):
+                p.unlink()
+
+
+def _start(sf):
+    return sf.lines[0][1:] if sf.lines else (0, 0)
+
+
+class ParseCache:
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.fields = FieldCache(self.directory / 'fields')
+
+    def key(self, p):
+        hasher = hashlib.sha256()
+        for path in [p] + SOURCES:
+            hasher.update(file_hash(path).digest())
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return self.directory / '{}.pickle'.format(key)
+
+    def __contains__(self, p):
+        return self._path(self.key(p)).exists()
+
+    def load(self, p, **kw):
+        """
+        :param kw: Keyword arguments passed into `Dictionary` in case of a cache miss.
+        :return: pair (`Dictionary`, `bool` flag signaling whether the cache was hit).
+        """
+        path = self._path(self.key(p))
+        if path.exists():
+            with path.open('rb') as f:
+                return pickle.load(f), True
+
+        workers = kw.pop('workers', None)
+        # Only semantic fields which are not in the field cache are parsed:
+        dictionary = self.fields.parse(Dictionary(p, **kw), workers=workers)
+        list(dictionary._iter_etyma())  # Make sure all etyma are parsed before pickling.
+        self.clear()
+        _dump(dictionary, path)
+        return dictionary, False
+
+    def clear(self):
+        """
+        Invalidate the cache by removing all cached dictionaries.
+        """
+        if self.directory.exists():
+            for p in self.directory.glob('*.pickle'):
+                p.unlink()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Inspect or clear the parse cache.')
+    parser.add_argument('cache_dir')
+    parser.add_argument('pmed_txt', nargs='?', default=None)
+    parser.add_argument('--clear', action='store_true', default=False)
+    args = parser.parse_args(args)
+    cache = ParseCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+        cache.fields.clear()
+    if args.pmed_txt:
+        print('hit' if args.pmed_txt in cache else 'miss')
+
+
+if __name__ == '__main__':
+    main()
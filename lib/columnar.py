@@ -0,0 +1,112 @@
+"""
+Columnar export of the reflexes and protoforms of a parsed `Dictionary` as Parquet or Arrow IPC
+(Feather) files, with one row per reflex or protoform.
+
+Each row carries the ID of its etymon - i.e. the ID of the corresponding cognate set in the CLDF
+data, numbering etyma in dictionary order starting with 1 - the page and line of the etymon and
+the semantic (sub)field. Columns with few distinct values are dictionary-encoded.
+
+Requires `pyarrow`.
+
+Usage:
+    python -m lib.columnar [--format parquet|feather] PMED_TXT OUTPUT_DIR
+"""
+import pathlib
+import argparse
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.feather
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+ETYMON_COLUMNS = ['etymon_id', 'page', 'line', 'semantic_field', 'semantic_subfield']
+REFLEX_COLUMNS = ETYMON_COLUMNS + [
+    'lang', 'orig_lang', 'form', 'pos', 'gloss_spanish', 'gloss_english', 'source', 'comment']
+PROTOFORM_COLUMNS = ETYMON_COLUMNS + [
+    'lang', 'orig_lang', 'form', 'pos', 'gloss_spanish', 'gloss_english', 'comment', 'number']
+INTEGER_COLUMNS = {'etymon_id', 'page', 'line'}
+DICTIONARY_COLUMNS = {
+    'semantic_field', 'semantic_subfield', 'lang', 'orig_lang', 'pos', 'source', 'number'}
+FORMATS = ['parquet', 'feather']
+
+
+def _gloss(gloss):
+    return (gloss.spanish, gloss.english) if gloss else (None, None)
+
+
+def iter_reflex_rows(dictionary):
+    for etymon_id, sf, etymon in dictionary.iter_numbered_etyma():
+        for r in etymon.reflexes:
+            yield (
+                etymon_id, etymon.page, etymon.line, sf.main, sf.sub,
+                r.lang, r.orig_lang, r.form, r.pos, *_gloss(r.gloss), r.source, r.comment)
+
+
+def iter_protoform_rows(dictionary):
+    for etymon_id, sf, etymon in dictionary.iter_numbered_etyma():
+        p = etymon.protoform
+        if p:
+            yield (
+                etymon_id, etymon.page, etymon.line, sf.main, sf.sub,
+                p.lang, p.orig_lang, p.form, p.pos, *_gloss(p.gloss), p.comment or None, p.number)
+
+
+def table(rows, columns):
+    """
+    Turn rows into an Arrow table, transposing them into columns in one go.
+    """
+    assert pyarrow, 'pyarrow must be installed for columnar export'
+    values = list(zip(*rows)) or [() for _ in columns]
+    arrays = []
+    for name, col in zip(columns, values):
+        array = pyarrow.array(
+            col, type=pyarrow.int32() if name in INTEGER_COLUMNS else pyarrow.string())
+        if name in DICTIONARY_COLUMNS:
+            array = array.dictionary_encode()
+        arrays.append(array)
+    return pyarrow.Table.from_arrays(arrays, names=columns)
+
+
+def tables(dictionary):
+    return dict(
+        reflexes=table(iter_reflex_rows(dictionary), REFLEX_COLUMNS),
+        protoforms=table(iter_protoform_rows(dictionary), PROTOFORM_COLUMNS),
+    )
+
+
+def write(dictionary, directory, format='parquet'):
+    """
+    Write `reflexes.<format>` and `protoforms.<format>` to `directory`.
+
+    :return: `list` of paths of the files written.
+    """
+    assert format in FORMATS, format
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    res = []
+    for name, t in tables(dictionary).items():
+        p = directory / '{}.{}'.format(name, format)
+        if format == 'parquet':
+            pyarrow.parquet.write_table(t, p)
+        else:
+            pyarrow.feather.write_feather(t, p)
+        res.append(p)
+    return res
+
+
+def main(args=None):
+    from .parser import Dictionary
+
+    parser = argparse.ArgumentParser(description='Export reflexes and protoforms as columnar data.')
+    parser.add_argument('pmed_txt')
+    parser.add_argument('output_dir')
+    parser.add_argument('--format', choices=FORMATS, default='parquet')
+    args = parser.parse_args(args)
+    for p in write(Dictionary(args.pmed_txt), args.output_dir, format=args.format):
+        print(p)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Structural diff between two versions of the dictionary.
+
+Etyma are keyed by protoform (language and form) and concept, reflexes by language, form and gloss
+(with a running number to tell apart entries with identical key). Entries are compared by hashes
+of their content - ignoring page and line numbers, which are reported as provenance - so the diff
+runs in time linear in the size of the dictionaries.
+
+Reported changes:
+- etyma added, removed or modified (i.e. with different semantic field, concept, protoform
+  details, comments or reflexes); an etymon whose key changed - e.g. because the protoform was
+  corrected - but whose semantic field and reflexes are unchanged is reported as modified,
+- reflexes added to, removed from or modified in an etymon,
+- reflexes moved from one etymon to another, i.e. changed cognate assignments.
+
+Usage:
+    python -m lib.diff [--json] [--workers N] OLD_PMED_TXT NEW_PMED_TXT
+"""
+import sys
+import json
+import argparse
+import collections
+
+ADDED, REMOVED, MODIFIED, MOVED = 'added', 'removed', 'modified', 'moved'
+SYMBOLS = {ADDED: '+', REMOVED: '-', MODIFIED: '~', MOVED: '>'}
+
+
+def _str(obj):
+    return str(obj) if obj else None
+
+
+def etymon_key(etymon):
+    p = etymon.protoform
+    return (p.lang, p.form) if p else (None, None), _str(etymon.concept)
+
+
+def reflex_key(reflex):
+    return reflex.lang, reflex.form, _str(reflex.gloss)
+
+
+class Entry:
+    """
+    An etymon with its semantic field, key and (hashable) content.
+    """
+    def __init__(self, key, sf, etymon):
+        self.key, self.sf, self.etymon = key, sf, etymon
+        p = etymon.protoform
+        self.attributes = dict(
+            semantic_field=(sf.main, sf.sub),
+            concept=_str(etymon.concept),
+            protoform=(p.orig_lang, p.pos, _str(p.gloss), p.comment or None, p.number)
+            if p else None,
+            comments=tuple(etymon.comments),
+        )
+        self.reflexes = {}
+        seen = collections.Counter()
+        for r in etymon.reflexes:
+            key = reflex_key(r)
+            seen[key] += 1
+            self.reflexes[key + (seen[key],)] = (r, (r.orig_lang, r.pos, r.source, r.comment))
+        # The order of reflexes doesn't matter:
+        self.reflexes_digest = frozenset(
+            (key, digest) for key, (_, digest) in self.reflexes.items())
+        self.digest = (tuple(self.attributes.values()), self.reflexes_digest)
+
+    def provenance(self):
+        return dict(
+            page=self.etymon.page,
+            line=self.etymon.line,
+            semantic_field=self.sf.main,
+            semantic_subfield=self.sf.sub,
+        )
+
+
+def entries(dictionary):
+    """
+    :return: `dict` mapping etymon keys to `Entry` objects, in dictionary order.
+    """
+    res, seen = {}, collections.Counter()
+    for sf in dictionary.semantic_fields:
+        for etymon in sf.etyma:
+            key = etymon_key(etymon)
+            seen[key] += 1
+            res[key + (seen[key],)] = Entry(key + (seen[key],), sf, etymon)
+    return res
+
+
+def _key_json(key):
+    (lang, form), concept, n = key
+    return dict(lang=lang, protoform=form, concept=concept, n=n)
+
+
+def _reflex_json(key, reflex):
+    return dict(lang=key[0], form=key[1], gloss=key[2], n=key[3], source=reflex.source)
+
+
+def _etymon_change(change, old=None, new=None, attributes=None):
+    res = dict(type='etymon', change=change, key=_key_json((new or old).key))
+    if old and new and old.key != new.key:
+        res['old_key'] = _key_json(old.key)
+    if attributes:
+        res['attributes'] = attributes
+    res.update(old=old.provenance() if old else None, new=new.provenance() if new else None)
+    return res
+
+
+def _reflex_change(change, key, reflex, old=None, new=None):
+    res = dict(type='reflex', change=change, reflex=_reflex_json(key, reflex))
+    for name, e in [('old', old), ('new', new)]:
+        res[name] = dict(etymon=_key_json(e.key), **e.provenance()) if e else None
+    return res
+
+
+def diff(old, new):
+    """
+    :param old: `Dictionary` instance.
+    :param new: `Dictionary` instance.
+    :return: `list` of changes, as JSON-serializable `dict`s.
+    """
+    old, new = entries(old), entries(new)
+    pairs, added = [], []
+    removed = {key: e for key, e in old.items() if key not in new}
+    # Etyma with new keys, but with identical semantic field and reflexes, count as modified:
+    rekeyed = {
+        (e.attributes['semantic_field'], e.reflexes_digest): e for e in removed.values()}
+    for key, e in new.items():
+        if key in old:
+            pairs.append((old[key], e))
+            continue
+        o = rekeyed.pop((e.attributes['semantic_field'], e.reflexes_digest), None)
+        if o:
+            del removed[o.key]
+            pairs.append((o, e))
+        else:
+            added.append(e)
+
+    res, reflexes_added, reflexes_removed = [], [], collections.defaultdict(list)
+    for o, n in pairs:
+        if o.digest == n.digest and o.key == n.key:
+            continue
+        attributes = sorted(k for k in n.attributes if o.attributes[k] != n.attributes[k])
+        if o.key != n.key:
+            attributes.insert(0, 'key')
+        if o.reflexes_digest != n.reflexes_digest:
+            attributes.append('reflexes')
+        res.append(_etymon_change(MODIFIED, o, n, attributes))
+        if o.reflexes_digest != n.reflexes_digest:
+            for key, (r, digest) in n.reflexes.items():
+                if key not in o.reflexes:
+                    reflexes_added.append((key, r, n))
+                elif o.reflexes[key][1] != digest:
+                    res.append(_reflex_change(MODIFIED, key, r, o, n))
+            for key, (r, _) in o.reflexes.items():
+                if key not in n.reflexes:
+                    reflexes_removed[key[:3]].append((key, r, o))
+
+    for e in added:
+        res.append(_etymon_change(ADDED, new=e))
+        reflexes_added.extend((key, r, e) for key, (r, _) in e.reflexes.items())
+    for e in removed.values():
+        res.append(_etymon_change(REMOVED, old=e))
+        for key, (r, _) in e.reflexes.items():
+            reflexes_removed[key[:3]].append((key, r, e))
+
+    # Reflexes removed from one etymon and added to another have been moved. Reflexes of added or
+    # removed etyma are only reported if moved.
+    added_etyma, removed_etyma = set(id(e) for e in added), set(id(e) for e in removed.values())
+    for key, r, e in reflexes_added:
+        if reflexes_removed.get(key[:3]):
+            _, _, o = reflexes_removed[key[:3]].pop(0)
+            res.append(_reflex_change(MOVED, key, r, o, e))
+        elif id(e) not in added_etyma:
+            res.append(_reflex_change(ADDED, key, r, new=e))
+    for items in reflexes_removed.values():
+        for key, r, o in items:
+            if id(o) not in removed_etyma:
+                res.append(_reflex_change(REMOVED, key, r, old=o))
+    return res
+
+
+def summary(changes):
+    return collections.Counter((c['type'], c['change']) for c in changes)
+
+
+def _format_key(key):
+    return '{} {} "{}"'.format(key['lang'] or '-', key['protoform'] or '-', key['concept'] or '')
+
+
+def _format_provenance(prov):
+    return 'p. {} l. {}'.format(prov['page'], prov['line']) if prov else ''
+
+
+def format_change(change):
+    if change['type'] == 'etymon':
+        res = '{} etymon {} ({})'.format(
+            SYMBOLS[change['change']],
+            _format_key(change['key']),
+            _format_provenance(change['new'] or change['old']))
+        if change.get('old_key'):
+            res += ' was {}'.format(_format_key(change['old_key']))
+        if change.get('attributes'):
+            res += ': {}'.format(', '.join(change['attributes']))
+        return res
+    r = change['reflex']
+    res = '{} reflex {} {} {}'.format(SYMBOLS[change['change']], r['lang'], r['form'], r['gloss'])
+    if change['change'] == MOVED:
+        return res + ' from {} ({}) to {} ({})'.format(
+            _format_key(change['old']['etymon']), _format_provenance(change['old']),
+            _format_key(change['new']['etymon']), _format_provenance(change['new']))
+    e = change['new'] or change['old']
+    return res + ' in {} ({})'.format(_format_key(e['etymon']), _format_provenance(e))
+
+
+def main(args=None):
+    from .parser import Dictionary
+
+    parser = argparse.ArgumentParser(description='Diff two versions of the dictionary.')
+    parser.add_argument('old_pmed_txt')
+    parser.add_argument('new_pmed_txt')
+    parser.add_argument('--json', action='store_true', default=False)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(args)
+
+    changes = diff(
+        Dictionary(args.old_pmed_txt, workers=args.workers),
+        Dictionary(args.new_pmed_txt, workers=args.workers))
+    if args.json:
+        print(json.dumps(changes, indent=2))
+    else:
+        for change in changes:
+            print(format_change(change))
+        for (type_, change), n in sorted(summary(changes).items()):
+            print('{} {} {}'.format(n, type_, change))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
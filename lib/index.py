@@ -0,0 +1,179 @@
+"""
+Index structures for fast lookups in a parsed `Dictionary`.
+"""
+import heapq
+import bisect
+import itertools
+import collections
+
+
+class SubstringIndex:
+    """
+    A suffix array over a list of strings, supporting substring queries.
+
+    A string `s` contains `item` iff `item` is a prefix of one of the suffixes of `s`, so all
+    strings containing `item` can be found by binary search in the sorted list of suffixes.
+    """
+    def __init__(self, strings):
+        suffixes = sorted(
+            (s[i:], n) for n, s in enumerate(strings) if s for i in range(len(s)))
+        self.suffixes = [s for s, _ in suffixes]
+        self.ids = [n for _, n in suffixes]
+
+    def iter_matches(self, item):
+        """
+        :return: Generator of indices (in the list of strings) of strings containing `item` -
+            possibly with duplicates and not in order.
+        """
+        i = bisect.bisect_left(self.suffixes, item)
+        while i < len(self.suffixes) and self.suffixes[i].startswith(item):
+            yield self.ids[i]
+            i += 1
+
+    def find_all(self, item):
+        return sorted(set(self.iter_matches(item)))
+
+    def find(self, item):
+        """
+        :return: Index of the first string containing `item` or `None`.
+        """
+        return min(self.iter_matches(item), default=None)
+
+
+class DistinctSubstringIndex:
+    """
+    A `SubstringIndex` over the distinct strings in a list of strings with many duplicates - such
+    as glosses or forms - mapping matches back to all positions in the list.
+    """
+    def __init__(self, strings):
+        self.positions = collections.defaultdict(list)
+        for i, s in enumerate(strings):
+            if s:
+                self.positions[s].append(i)
+        self.strings = list(self.positions)
+        self.index = SubstringIndex(self.strings)
+
+    def find_all(self, item):
+        return sorted(
+            i for n in self.index.find_all(item) for i in self.positions[self.strings[n]])
+
+
+class LevenshteinPattern:
+    """
+    Levenshtein distances of strings to a fixed pattern, computed with the bit-parallel algorithm
+    of Myers (1999) in the formulation of Hyyrö (2001): The differences between adjacent cells of a
+    column of the dynamic programming matrix are encoded in the bits of integers, so each column is
+    computed with a few bit operations.
+    """
+    def __init__(self, pattern):
+        self.length = len(pattern)
+        self.peq = collections.defaultdict(int)  # Bit masks of the positions of chars in pattern.
+        for i, c in enumerate(pattern):
+            self.peq[c] |= 1 << i
+        self.peq = dict(self.peq)
+        self.full = (1 << self.length) - 1
+        self.last = 1 << (self.length - 1) if self.length else 0
+
+    def distance(self, s):
+        if not self.length:
+            return len(s)
+        peq, full, last = self.peq, self.full, self.last
+        pv, mv, score = full, 0, self.length
+        for c in s:
+            eq = peq.get(c, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | (~(xh | pv) & full)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = ((ph << 1) | 1) & full
+            mh = (mh << 1) & full
+            pv = mh | (~(xv | ph) & full)
+            mv = ph & xv
+        return score
+
+
+def levenshtein(a, b):
+    return LevenshteinPattern(a).distance(b)
+
+
+def trigrams(s):
+    """
+    Multiset of the trigrams of `s`, padded such that a string of length n has n + 2 trigrams.
+    """
+    s = '\0\0{}\0\0'.format(s)
+    return collections.Counter(s[i:i + 3] for i in range(len(s) - 2))
+
+
+class FuzzyIndex:
+    """
+    An index for approximate string matching, i.e. for finding the strings closest to a query in
+    terms of Levenshtein distance.
+
+    Since a single edit operation changes at most 3 trigrams, two strings with n and m trigrams
+    sharing c of them have a distance of at least (max(n, m) - c) / 3. Using this lower bound - and
+    the length difference - candidates can be ranked by trigram overlap and most strings can be
+    skipped without computing their distance.
+    """
+    def __init__(self, strings):
+        self.positions = collections.defaultdict(list)
+        for i, s in enumerate(strings):
+            if s:
+                self.positions[s].append(i)
+        self.strings = list(self.positions)
+        self.postings = collections.defaultdict(list)
+        self.by_length = collections.defaultdict(list)
+        for n, s in enumerate(self.strings):
+            for t, c in trigrams(s).items():
+                self.postings[t].append((n, c))
+            self.by_length[len(s)].append(n)
+
+    def search(self, item, k=10, max_distance=None):
+        """
+        :return: `list` of up to `k` triples `(distance, string, positions)` ordered by distance.
+        """
+        if k < 1:
+            return []
+        shared = collections.Counter()
+        for t, qc in trigrams(item).items():
+            for n, c in self.postings.get(t, []):
+                shared[n] += min(qc, c)
+
+        # Group strings by lower bound of their distance to the query - strings without shared
+        # trigrams by length:
+        candidates, lengths = collections.defaultdict(list), collections.defaultdict(list)
+        for n, c in shared.items():
+            candidates[self._lower_bound(len(self.strings[n]), len(item), c)].append(n)
+        for length in self.by_length:
+            lengths[self._lower_bound(length, len(item), 0)].append(length)
+
+        pattern = LevenshteinPattern(item)
+        best = []  # Heap of `(-distance, -n)`, i.e. with the worst of the best k on top.
+        bound = max_distance
+        for lb in sorted(set(candidates) | set(lengths)):
+            if bound is not None and lb > bound:
+                break
+            ns = itertools.chain(
+                candidates.get(lb, []),
+                (n for length in lengths.get(lb, []) for n in self.by_length[length]
+                 if n not in shared))
+            for n in ns:
+                d = pattern.distance(self.strings[n])
+                if bound is not None and d > bound:
+                    continue
+                heapq.heappush(best, (-d, -n))
+                if len(best) > k:
+                    heapq.heappop(best)
+                if len(best) == k:
+                    bound = -best[0][0] if max_distance is None else \
+                        min(max_distance, -best[0][0])
+        return [
+            (-d, self.strings[-n], self.positions[self.strings[-n]])
+            for d, n in sorted(best, reverse=True)]
+
+    @staticmethod
+    def _lower_bound(length, qlength, shared):
+        return max(abs(length - qlength), -(-(max(length, qlength) + 2 - shared) // 3))
@@ -1,68 +1,181 @@
+"""
+Languoids - i.e. the rows of `etc/languages.csv` - and resolution of language specifications.
+
+The languoid table is read upon first access rather than at import time, and only requires the
+standard library. If the environment variable `PMED_LANGUOIDS_SNAPSHOT` points to an up-to-date
+snapshot of the table, as written by the CLI, the snapshot is read instead of the CSV file.
+
+Usage:
+    python -m lib.languoids SNAPSHOT
+"""
+import os
+import csv
+import sys
+import marshal
 import pathlib
+import argparse
+import functools
+import collections.abc
+
+CSV = pathlib.Path(__file__).parent.parent / 'etc' / 'languages.csv'
+SNAPSHOT_ENV_VAR = 'PMED_LANGUOIDS_SNAPSHOT'
+
+
+class LanguoidTable(collections.abc.Mapping):
+    """
+    A read-only mapping of languoid IDs to rows of the languoid table, loaded lazily.
+    """
+    def __init__(self, path, snapshot=None):
+        self.path = pathlib.Path(path)
+        self.snapshot = pathlib.Path(snapshot) if snapshot else None
+
+    def _stamp(self):
+        st = self.path.stat()
+        return st.st_size, st.st_mtime_ns
+
+    @functools.cached_property
+    def _rows(self):
+        if self.snapshot and self.snapshot.exists():
+            # Note: `marshal.loads` is an order of magnitude faster than `marshal.load` on a file.
+            stamp, rows = marshal.loads(self.snapshot.read_bytes())
+            if stamp == self._stamp():
+                return rows
+        with self.path.open(encoding='utf8', newline='') as f:
+            return {r['ID']: r for r in csv.DictReader(f)}
+
+    def write_snapshot(self, path):
+        """
+        Write the table to `path` in `marshal` format, which is considerably faster to load than
+        CSV. The snapshot is only used as long as the CSV file is unchanged.
+        """
+        path = pathlib.Path(path)
+        tmp = path.with_suffix('.tmp')
+        with tmp.open('wb') as f:
+            marshal.dump((self._stamp(), dict(self._rows)), f)
+        tmp.replace(path)
+        return path
+
+    def __getitem__(self, key):
+        return self._rows[key]
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
 
-from csvw.dsv import reader
+LANGUOIDS = LanguoidTable(CSV, snapshot=os.environ.get(SNAPSHOT_ENV_VAR))
 
 
-LANGUOIDS = {
-    r['ID']: r
-    for r in reader(pathlib.Path(__file__).parent.parent / 'etc' / 'languages.csv', dicts=True)}
+ALIASES = {
+    'pPoqom': 'pPOQ',
+    'POQ': 'pPOQ',
+    'pWas': 'pWa',
+    'Was': 'pWa',
+    'WAS+LL': 'pWa+LL',
+    "Ch'olan": 'pCh',
+    "Ch": 'pCh',
+    "pCh'olan": 'pCh',
+    'ColKaq': 'KAQcol',
+    'Tzo': 'TZO',
+    'Tze': 'TZE',
+    'QEQc&l': 'QEQe',  # Same extension, same forms
+    'QEQl&c': 'QEQe',
+    'QEQw/e': 'QEQ',  # Only appears in one cognate set, with QEQc&l having identical form.
+    'M': 'pM',
+    'pChl': 'pCh',  # One case also has reflexes in, e.g., AKA, though.
+    'pYUK': 'pYu',
+    'pWAS': 'pWa',  # One reflex for an etymon of pM.
+    # Missing proto-marker:
+    'P': 'pP',
+    'eKP': 'pKp',
+    'Kp': 'pKp',
+    'Mp': 'pMp',
+    'Yu': 'pYu',
+    'UK': 'pUK',
+    'GK': 'pGK',
+    'GM': 'pGM',
+    'GQ': 'pGQ',
+    'GTz': 'pGTz',
+    'Tzp': 'pTzp',
+    'Tz': 'pTzp',  # One etymon Tz+ with reflexes in TZO, TZE, MAM
+    'pTz': 'pGTz',  # One etymon pTz with reflexes in pCh and CHR
+    'pI': 'pIx',  # One etymon with reflexes in AWA and IXL.
+    'Ip': 'pIx',  # One etymon with reflexes in AWA and IXL.
+    'I': 'pIx',  # A handful of etyma with reflexes in AWA and IXL.
+    'pIXL': 'pIx',  # One etymon for "pre-IXL"
+    'TCh': 'pChT',  # Several etyma with reflexes in CHJ, TOJ (and in one case TUZ)
+    'PQ': 'pPQ',
+    'pQ': 'pQp',
+    'QK': 'pGK',  # One etymon 'QK+' with reflexes from K'iche'an and MAM
+    'Qp': 'pQp',  # Several etyma with reflexes in QAN, AKA, POP (and in two cases CHJ and TUZ)
+    'Q': 'pGQ',  # One etymon Kp+Q with reflexes also in MCH
+    # Misc.
+    'pQa': 'pGQ',  # Two etyma, with reflexes in GQ
+    'pMAM': 'MAM',  # appears only for one reflex: pMAM     mooyh
+    'CM': 'pCM',  # Reconstructions assigned to a major genetic grouping
+    'EM': 'pEM',  # Reconstructions assigned to a major genetic grouping
+    'WM': 'pWM',  # Reconstructions assigned to a major genetic grouping
+    #'NEG': 'LL+pCM', ?
+}
+
+
+class LanguoidResolver:
+    """
+    Resolves language specifications - i.e. `+`-separated lists of language codes or aliases -
+    to sorted lists of languoid IDs.
+
+    Since the same few hundred distinct language specifications are resolved over and over
+    again, results are memoized in an LRU cache.
+    """
+    def __init__(self, languoids, aliases, maxsize=4096):
+        self.languoids = languoids
+        self.aliases = aliases
+        self._resolve = functools.lru_cache(maxsize=maxsize)(self._resolve)
+
+    def _resolve(self, s):
+        comps = [
+            comp.replace('pre-', 'p').replace('?', '').replace('+', '').replace('*', '')
+            for comp in s.split('+') if comp]
+        comps = [self.aliases.get(comp, comp) for comp in comps]
+        if all(comp in self.languoids for comp in comps):
+            comps = tuple(sorted(comps))
+            return comps, s if '+'.join(comps) != s else None
+
+    def __call__(self, s):
+        """
+        :return: `None` if `s` cannot be resolved, else a pair (`list` of languoid IDs, `s` if
+        different from the normalized specification).
+        """
+        res = self._resolve(s)
+        if res:
+            return list(res[0]), res[1]
+
+    def resolve_all(self, specs):
+        """
+        Batch API, resolving a list of language specifications.
+        """
+        return [self(s) for s in specs]
+
+
+RESOLVER = LanguoidResolver(LANGUOIDS, ALIASES)
 
 
 def match_languoids(s):
-    comps = [ss for ss in s.split('+') if ss]
-    comps = [comp.replace('pre-', 'p').replace('?', '').replace('+', '').replace('*', '')
-             for comp in comps]
-    comps = [{
-        'pPoqom': 'pPOQ',
-        'POQ': 'pPOQ',
-        'pWas': 'pWa',
-        'Was': 'pWa',
-        'WAS+LL': 'pWa+LL',
-        "Ch'olan": 'pCh',
-        "Ch": 'pCh',
-        "pCh'olan": 'pCh',
-        'ColKaq': 'KAQcol',
-        'Tzo': 'TZO',
-        'Tze': 'TZE',
-        'QEQc&l': 'QEQe',  # Same extension, same forms
-        'QEQl&c': 'QEQe',
-        'QEQw/e': 'QEQ',  # Only appears in one cognate set, with QEQc&l having identical form.
-        'M': 'pM',
-        'pChl': 'pCh',  # One case also has reflexes in, e.g., AKA, though.
-        'pYUK': 'pYu',
-        'pWAS': 'pWa',  # One reflex for an etymon of pM.
-        # Missing proto-marker:
-        'P': 'pP',
-        'eKP': 'pKp',
-        'Kp': 'pKp',
-        'Mp': 'pMp',
-        'Yu': 'pYu',
-        'UK': 'pUK',
-        'GK': 'pGK',
-        'GM': 'pGM',
-        'GQ': 'pGQ',
-        'GTz': 'pGTz',
-        'Tzp': 'pTzp',
-        'Tz': 'pTzp',  # One etymon Tz+ with reflexes in TZO, TZE, MAM
-        'pTz': 'pGTz',  # One etymon pTz with reflexes in pCh and CHR
-        'pI': 'pIx',  # One etymon with reflexes in AWA and IXL.
-        'Ip': 'pIx',  # One etymon with reflexes in AWA and IXL.
-        'I': 'pIx',  # A handful of etyma with reflexes in AWA and IXL.
-        'pIXL': 'pIx',  # One etymon for "pre-IXL"
-        'TCh': 'pChT',  # Several etyma with reflexes in CHJ, TOJ (and in one case TUZ)
-        'PQ': 'pPQ',
-        'pQ': 'pQp',
-        'QK': 'pGK',  # One etymon 'QK+' with reflexes from K'iche'an and MAM
-        'Qp': 'pQp',  # Several etyma with reflexes in QAN, AKA, POP (and in two cases CHJ and TUZ)
-        'Q': 'pGQ',  # One etymon Kp+Q with reflexes also in MCH
-        # Misc.
-        'pQa': 'pGQ',  # Two etyma, with reflexes in GQ
-        'pMAM': 'MAM',  # appears only for one reflex: pMAM     mooyh
-        'CM': 'pCM',  # Reconstructions assigned to a major genetic grouping
-        'EM': 'pEM',  # Reconstructions assigned to a major genetic grouping
-        'WM': 'pWM',  # Reconstructions assigned to a major genetic grouping
-        #'NEG': 'LL+pCM', ?
-    }.get(comp, comp) for comp in comps]
-    if all(comp in LANGUOIDS for comp in comps):
-        comps = sorted(comps)
-        return comps, s if '+'.join(comps) != s else None
+    return RESOLVER(s)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Write a snapshot of the languoid table.')
+    parser.add_argument('snapshot')
+    args = parser.parse_args(args)
+    print(LANGUOIDS.write_snapshot(args.snapshot))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
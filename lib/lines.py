@@ -1,7 +1,10 @@
 import re
 import itertools
+import collections
 import dataclasses
 
+from .metrics import METRICS
+
 BLOCKS = {
     """\
      EpM(Ch)   <RED-ch'o-ko> /chak=ch'ok/                             infant
@@ -255,35 +258,199 @@ LINES = {
 }
 
 
-def fix_blocks(text):
-    for k, v in BLOCKS.items():
-        assert k in text
-        text = text.replace(k, v)
-    return text
+# Substring replacements, applied to the whole text:
+SUBSTITUTIONS = {
+    'ANALYZE': '',  # Remove internal comment.
+    '*//tu7l-ul//': '*/tu7l-ul/',
+    'eGK': 'pGK',
+}
+
+
+class Patches:
+    """
+    Tables of literal replacements, compiled into a single alternation pattern, such that all
+    replacements can be applied in one pass over a text.
+
+    Hits are counted per rule, keyed by `(table name, key)`, in a `Counter` passed by the caller.
+    """
+    def __init__(self, **tables):
+        self.tables = tables
+        self.replacements = {}
+        for name, table in tables.items():
+            for k, v in table.items():
+                assert k not in self.replacements, k
+                self.replacements[k] = (name, v)
+        # Longest keys first, to give precedence to the longest match at any position.
+        self.pattern = re.compile('|'.join(
+            re.escape(k) for k in sorted(self.replacements, key=len, reverse=True)))
+
+    def rules(self):
+        for name, table in self.tables.items():
+            for k in table:
+                yield name, k
+
+    def _replacement(self, m, hits):
+        name, v = self.replacements[m.group()]
+        if hits is not None:
+            hits[name, m.group()] += 1
+        return v
+
+    def sub(self, text, hits=None):
+        return self.pattern.sub(lambda m: self._replacement(m, hits), text)
+
+    def iter_lines(self, chunks, hits=None):
+        """
+        Apply the replacements to a stream of text chunks, yielding lines.
+
+        The result is the same as for `self.sub(''.join(chunks)).split('\\n')`, but only a buffer
+        of about the size of a chunk (plus the length of the longest key) is kept in memory.
+        """
+        maxlen = max(len(k) for k in self.replacements)
+        buf, line = '', ''
+        for chunk in itertools.chain(chunks, [None]):
+            buf += chunk or ''
+            # Matches starting before cutoff are guaranteed to be complete.
+            cutoff = len(buf) if chunk is None else len(buf) - maxlen + 1
+            out, pos = [line], 0
+            for m in self.pattern.finditer(buf):
+                if m.start() >= cutoff:
+                    break
+                out.extend([buf[pos:m.start()], self._replacement(m, hits)])
+                pos = m.end()
+            if pos < cutoff:
+                out.append(buf[pos:cutoff])
+                pos = cutoff
+            buf = buf[pos:]
+            *lines, line = ''.join(out).split('\n')
+            yield from lines
+        yield line
+
+
+SUBSTITUTION_PATCHES = Patches(SUBSTITUTIONS=SUBSTITUTIONS)
+
+
+def substitute(s):
+    return SUBSTITUTION_PATCHES.sub(s)
+
+
+# Since blocks are replaced in the same pass as substitutions are made, the substitutions must be
+# applied to the replacement values up-front.
+TEXT_PATCHES = Patches(
+    BLOCKS={k: substitute(v) for k, v in BLOCKS.items()},
+    SUBSTITUTIONS=SUBSTITUTIONS)
+# LINES are looked up in text with substitutions applied, so we normalize the keys accordingly:
+FIXED_LINES = {substitute(k): (k, substitute(v)) for k, v in LINES.items()}
+
+
+def unmatched(hits):
+    """
+    :param hits: `Counter` of hits as collected by `iter_fixed_blocks` and `iter_lines`.
+    :return: `list` of `(table name, key)` pairs for fixes which did not match.
+    """
+    rules = itertools.chain(
+        TEXT_PATCHES.rules(),
+        (('LINES', k) for k in LINES),
+        (('CONTINUATION_LINES', cl.lines[0]) for cl in CONTINUATION_LINES))
+    return [rule for rule in rules if not hits[rule]]
+
+
+@dataclasses.dataclass
+class Anomaly:
+    """
+    A problem found when parsing the dictionary in validation mode.
+    """
+    rule: str
+    text: str
+    page: int = None
+    line: int = None
+    message: str = None
+    semantic_field: str = None
+
+
+def anomaly(anomalies, rule, text, page=None, line=None, message=None):
+    """
+    Signal a parse anomaly: If `anomalies` is a `list` - i.e. in validation mode - the anomaly is
+    recorded and the caller recovers, otherwise an `AssertionError` is raised.
+    """
+    if anomalies is None:
+        raise AssertionError(text if message is None else message)
+    anomalies.append(Anomaly(rule, text, page, line, message))
+
+
+def iter_fixed_blocks(chunks, hits=None, anomalies=None):
+    """
+    Replace BLOCKS and make SUBSTITUTIONS in a single pass over the text, yielding the lines of
+    the fixed text. Once the text is exhausted, BLOCKS which did not match are signaled as
+    anomalies.
+    """
+    hits = collections.Counter() if hits is None else hits
+    yield from TEXT_PATCHES.iter_lines(chunks, hits)
+    for k in BLOCKS:
+        if not hits['BLOCKS', k]:
+            anomaly(anomalies, 'unmatched-block', k, message=k)
+
+
+def iter_chunks(p, size=2 ** 16):
+    with p.open(encoding='utf8') as f:
+        yield from iter(lambda: f.read(size), '')
 
 
 @dataclasses.dataclass
 class ContinuationLines:
     lines: list[str]
     concatenated: str = None
-    matched: list[int] = dataclasses.field(default_factory=list)
+    # The lines as they appear in the raw text, i.e. before SUBSTITUTIONS are made:
+    raw_lines: list[str] = dataclasses.field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Lines are matched against text with SUBSTITUTIONS already made.
+        self.raw_lines = self.lines
+        self.lines = [substitute(line) for line in self.lines]
+        if self.concatenated:
+            self.concatenated = substitute(self.concatenated)
 
     @property
-    def all_matched(self):
-        return not self.lines
-
-    def maybe_replace(self, line):
-        if all(i in self.matched for i, _ in enumerate(self.lines)):
-            self.lines = []
-        for i, l in enumerate(self.lines):
-            if l.strip() == line.strip():
-                self.matched.append(i)
-                if i == 0:  # Matches the first line, return concatenation of all lines.
-                    assert self.matched == [0], l
-                    if self.concatenated:
-                        return self.concatenated, True
-                    return l + ' ' + ' '.join(self.lines[1:]), True
-                return None, True
+    def replacement(self):
+        if self.concatenated:
+            return self.concatenated
+        return self.lines[0] + ' ' + ' '.join(self.lines[1:])
+
+
+class ContinuationMatcher:
+    """
+    Matches lines against a list of `ContinuationLines` rules.
+
+    Rather than comparing each line with each rule, we look up the stripped line in an index
+    mapping stripped lines to rules and positions within rules. The state of each rule - i.e. the
+    positions matched so far - is kept per matcher, i.e. per pass over a text.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.index = {}
+        for i, rule in enumerate(rules):
+            for j, line in enumerate(rule.lines):
+                # Only the first position of a line within a rule can be matched.
+                self.index.setdefault(line.strip(), {}).setdefault(i, j)
+        self.matched = [[] for _ in rules]
+        self.positions = [set() for _ in rules]
+
+    def match(self, line, hits=None, anomalies=None):
+        """
+        :return: pair (replacement line or `None`, `bool` flag signaling whether a rule matched)
+        """
+        for i, j in self.index.get(line.strip(), {}).items():
+            rule = self.rules[i]
+            if len(self.positions[i]) == len(rule.lines):  # All lines of the rule matched already.
+                continue
+            if j == 0 and self.matched[i]:  # The first line of a rule must match only once.
+                anomaly(anomalies, 'continuation-rule', rule.lines[0], message=rule.lines[0])
+            self.matched[i].append(j)
+            self.positions[i].add(j)
+            if j == 0:
+                if hits is not None:
+                    hits['CONTINUATION_LINES', rule.lines[0]] += 1
+                return rule.replacement, True
+            return None, True
         return line, False
 
 
@@ -357,47 +524,74 @@ CONTINUATION_LINES = [
 ]
 
 
-def iter_fixed_lines(lines):
+def iter_fixed_lines(lines, hits=None, anomalies=None):
+    continuation_lines = ContinuationMatcher(CONTINUATION_LINES)
     for line, page, lineno in etymologies_lines(lines):
-        for cl in CONTINUATION_LINES:
-            if not cl.all_matched:
-                line, replaced = cl.maybe_replace(line)
-                if replaced:
-                    break
-
+        line, _ = continuation_lines.match(line, hits, anomalies)
         if line is None:
             continue
 
-        line = line.replace('ANALYZE', '').replace('*//tu7l-ul//', '*/tu7l-ul/')  # Remove internal comment.
-        line = LINES.get(line, line).replace('eGK', 'pGK')
+        if line in FIXED_LINES:
+            k, line = FIXED_LINES[line]
+            if hits is not None:
+                hits['LINES', k] += 1
         for ll in line.split('\n'):
             yield ll, page, lineno
 
 
 def iter_continued_lines(lines):
-    # All lines that start with a 50 space offset are continuation lines.
-    lines = list(iter_fixed_lines(lines))
-    new, cont = [], []
-    for line, page, lineno in reversed(lines):
+    """
+    All lines that start with a 50 space offset are continuation lines, i.e. are appended to the
+    closest preceding line that is neither blank nor a continuation line. Blank lines preceding
+    continuation lines are ignored.
+
+    Only the current line, its continuations and subsequent blank lines are buffered.
+    """
+    head, cont, blanks = None, [], []
+    for line, page, lineno in lines:
         if line.startswith(50 * " "):
             cont.append(line.strip())
+            blanks = []
             continue
-        if cont and not line.strip():
-            # Ignore blank lines preceding continuation lines.
+        if not line.strip():
+            blanks.append((line, page, lineno))
             continue
-        if cont:
-            line = '{} {}'.format(line, ' '.join(reversed(cont)))
-            cont = []
-        new.append((line, page, lineno))
-    yield from reversed(new)
+        if head:
+            yield _continued(head, cont)
+        cont = []  # Continuation lines without preceding line are dropped.
+        yield from blanks
+        head, blanks = (line, page, lineno), []
+    if head:
+        yield _continued(head, cont)
+    yield from blanks
+
 
+def _continued(head, cont):
+    if cont:
+        line, page, lineno = head
+        return '{} {}'.format(line, ' '.join(cont)), page, lineno
+    return head
 
-def iter_lines(lines):
+
+def iter_lines(lines, hits=None, anomalies=None):
     comment, in_comment = [], False
 
-    for line, page, lineno in iter_continued_lines(iter_lines_with_pagenumbers(lines)):
+    lines = METRICS.stage(
+        'lines.iter_lines_with_pagenumbers', iter_lines_with_pagenumbers(lines, anomalies))
+    lines = METRICS.stage(
+        'lines.iter_fixed_lines', iter_fixed_lines(lines, hits=hits, anomalies=anomalies))
+    lines = METRICS.stage('lines.iter_continued_lines', iter_continued_lines(lines))
+    for line, page, lineno in lines:
+        if in_comment and comment and line.startswith(' '):
+            # Unterminated comment: We close it and process the line as usual.
+            anomaly(
+                anomalies, 'unterminated-comment', comment[0], page, lineno,
+                '{}: {}'.format(lineno, line))
+            in_comment = False
+            yield ' '.join(comment), page, lineno
+            comment = []
+
         if in_comment:  # comment continuation line
-            assert comment and not line.startswith(' '), '{}: {}'.format(lineno, line)
             comment.append(line.strip())
             if line.strip().endswith(']'):
                 in_comment = False
@@ -418,7 +612,7 @@ def iter_lines(lines):
         yield line, page, lineno
 
 
-def iter_lines_with_pagenumbers(lines):
+def iter_lines_with_pagenumbers(lines, anomalies=None):
     page_number_line = re.compile(
         r'(?P<page>[0-9]+)\s+Kaufman: preliminary Mayan Etymological Dictionary')
     page = None
@@ -426,9 +620,11 @@ def iter_lines_with_pagenumbers(lines):
     for lineno, line in enumerate(lines):
         m = page_number_line.match(line)
         if m:
-            if page:
-                assert int(m.group('page')) == page + 1, line
-            page = int(m.group('page'))
+            if page and int(m.group('page')) != page + 1:
+                anomaly(anomalies, 'page-number', line, page + 1, lineno, line)
+                page += 1  # We trust the page count rather than the wrong number.
+            else:
+                page = int(m.group('page'))
         else:
             yield line, 1 if page is None else page + 1, lineno
 
@@ -0,0 +1,183 @@
+"""
+Integer-coded NumPy arrays of the forms and cognates of a parsed `Dictionary`, and dataset
+statistics computed from them.
+
+Forms and cognates are derived as in `write_dictionary`, i.e.
+- forms are the distinct `(language, form, gloss)` combinations of protoforms (in languages listed
+  in `etc/languages.csv`) and reflexes, with concepts identified by the slug of the gloss,
+- each reflex with a form is a cognate in the cognate set of its etymon (numbered in dictionary
+  order).
+
+Languages are coded by their position in `etc/languages.csv`, cognate sets by etymon ID - 1 and
+concepts by order of first appearance. The statistics are those reported by `pylexibank` in the
+README (but computed without a pass over the CLDF data), plus per-language reflex counts and
+coverage, i.e. the share of cognate sets a language has a reflex in.
+
+Requires `numpy`. Note that the CLI counts each form as one lexeme, while `cmd_makecldf` splits
+forms into lexemes with the dataset's `FormSpec`, just like the CLDF writer.
+
+Usage:
+    python -m lib.matrix [--json] PMED_TXT
+"""
+import sys
+import json
+import argparse
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from clldutils.misc import slug
+
+from .languoids import LANGUOIDS
+
+
+def concept_id(gloss):
+    return slug(str(gloss or 'nogloss')) or 'nogloss'
+
+
+class PresenceMatrix:
+    """
+    :ivar languages: `list` of language IDs (slugged as in the CLDF data).
+    :ivar concepts: `list` of concept IDs.
+    :ivar form_language: language codes of forms.
+    :ivar form_concept: concept codes of forms.
+    :ivar form_lexemes: number of lexemes per form (i.e. > 1 if a form is split into lexemes).
+    :ivar cognate_language: language codes of cognates.
+    :ivar cognate_set: cognate set codes of cognates.
+    :ivar presence: boolean `languages x cognate sets` matrix.
+    """
+    def __init__(self, dictionary, split=None):
+        """
+        :param split: Callable splitting a form into a list of lexemes, e.g. `FormSpec.split`.
+        """
+        assert numpy, 'numpy must be installed for the presence matrix'
+        self.languages = [slug(lid, lowercase=False) for lid in LANGUOIDS]
+        self.glottocodes = [r['Glottocode'] for r in LANGUOIDS.values()]
+        self.concepts = []
+
+        lcodes = {lid: i for i, lid in enumerate(self.languages)}
+        lids, ccodes, concepts = {}, {}, {}
+        forms, form_language, form_concept, form_lexemes = set(), [], [], []
+        cognate_language, cognate_set = [], []
+
+        def language(lang):
+            if lang not in lids:
+                lids[lang] = lcodes.get(slug(lang, lowercase=False))
+            return lids[lang]
+
+        def concept(gloss):
+            if gloss not in concepts:
+                cid = concept_id(gloss)
+                if cid not in ccodes:
+                    ccodes[cid] = len(self.concepts)
+                    self.concepts.append(cid)
+                concepts[gloss] = ccodes[cid]
+            return concepts[gloss]
+
+        def add_form(fk, obj):
+            if fk not in forms:
+                forms.add(fk)
+                form_language.append(language(obj.lang))
+                form_concept.append(concept(obj.gloss))
+                form_lexemes.append(len(split(obj.form)) if split else 1)
+
+        nsets = 0
+        for etymon_id, _, e in dictionary.iter_numbered_etyma():
+            nsets = etymon_id
+            p = e.protoform
+            if p and p.form and p.lang and language(p.lang) is not None:
+                add_form((p.lang, p.form, p.gloss or ''), p)
+            for r in e.reflexes:
+                if r.form:
+                    assert language(r.lang) is not None, r.lang
+                    add_form((r.lang, r.form, r.gloss), r)
+                    cognate_language.append(language(r.lang))
+                    cognate_set.append(etymon_id - 1)
+
+        self.form_language = numpy.array(form_language, dtype=numpy.int32)
+        self.form_concept = numpy.array(form_concept, dtype=numpy.int32)
+        self.form_lexemes = numpy.array(form_lexemes, dtype=numpy.int32)
+        self.cognate_language = numpy.array(cognate_language, dtype=numpy.int32)
+        self.cognate_set = numpy.array(cognate_set, dtype=numpy.int32)
+        self.presence = numpy.zeros((len(self.languages), nsets), dtype=bool)
+        self.presence[self.cognate_language, self.cognate_set] = True
+
+    def statistics(self):
+        """
+        :return: `dict` of statistics.
+        """
+        nlanguages, nconcepts = len(self.languages), max(len(self.concepts), 1)
+        # Forms which are split into no lexemes at all don't count.
+        attested = self.form_lexemes > 0
+        lexemes = numpy.bincount(
+            self.form_language, weights=self.form_lexemes, minlength=nlanguages).astype(int)
+        varieties = lexemes > 0
+        # Concepts per language are counted as distinct (language, concept) pairs:
+        pairs = numpy.unique(
+            self.form_language[attested].astype(numpy.int64) * nconcepts
+            + self.form_concept[attested])
+        concepts_per_language = numpy.bincount(pairs // nconcepts, minlength=nlanguages)
+        cognates_per_set = numpy.bincount(self.cognate_set, minlength=self.presence.shape[1])
+        reflexes = numpy.bincount(self.cognate_language, minlength=nlanguages)
+
+        nlexemes = int(lexemes.sum())
+        concepts = int(numpy.unique(self.form_concept[attested]).size)
+        cognate_sets = int(numpy.count_nonzero(cognates_per_set))
+        return dict(
+            varieties=int(numpy.count_nonzero(varieties)),
+            glottocodes=len(
+                {self.glottocodes[i] for i in numpy.flatnonzero(varieties)} - {'', None}),
+            concepts=concepts,
+            lexemes=nlexemes,
+            synonymy=float(
+                (lexemes[varieties] / concepts_per_language[varieties]).mean())
+            if varieties.any() else 0.0,
+            cognates=int(self.cognate_set.size),
+            cognate_sets=cognate_sets,
+            singletons=int(numpy.count_nonzero(cognates_per_set == 1)),
+            # see List et al. 2017
+            cognate_diversity=(cognate_sets - concepts) / (nlexemes - concepts)
+            if nlexemes != concepts else 0.0,
+            reflexes={
+                self.languages[i]: int(reflexes[i]) for i in numpy.flatnonzero(reflexes)},
+            coverage={
+                self.languages[i]: float(n / cognate_sets)
+                for i, n in enumerate(self.presence.sum(axis=1)) if n},
+        )
+
+
+def readme_lines(stats):
+    """
+    :return: `list` of lines formatted like the statistics in the README.
+    """
+    return [
+        '- **Varieties:** {0:,} (linked to {1:,} different Glottocodes)'.format(
+            stats['varieties'], stats['glottocodes']),
+        '- **Concepts:** {0:,}'.format(stats['concepts']),
+        '- **Lexemes:** {0:,}'.format(stats['lexemes']),
+        '- **Synonymy:** {:0.2f}'.format(stats['synonymy']),
+        '- **Cognacy:** {0:,} cognates in {1:,} cognate sets ({2:,} singletons)'.format(
+            stats['cognates'], stats['cognate_sets'], stats['singletons']),
+        '- **Cognate Diversity:** {:0.2f}'.format(stats['cognate_diversity']),
+    ]
+
+
+def main(args=None):
+    from .parser import Dictionary
+
+    parser = argparse.ArgumentParser(description='Compute dataset statistics.')
+    parser.add_argument('pmed_txt')
+    parser.add_argument('--json', action='store_true', default=False)
+    args = parser.parse_args(args)
+    stats = PresenceMatrix(Dictionary(args.pmed_txt)).statistics()
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print('\n'.join(readme_lines(stats)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
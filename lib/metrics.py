@@ -0,0 +1,146 @@
+"""
+Opt-in instrumentation of the parse pipeline.
+
+Instrumentation is disabled by default. It is enabled by setting the environment variable
+`PMED_METRICS` to the path of a JSON file the metrics are written to (by `cmd_makecldf`), or by
+calling `METRICS.enable()`. When disabled, instrumented stages are passed through unchanged and
+timers are no-ops, i.e. the overhead is one function call per stage or semantic field.
+
+Timings of generator stages are cumulative, i.e. include the time spent in upstream stages, but
+not the time spent by consumers.
+
+Usage:
+    python -m lib.metrics PMED_TXT [--workers N]
+"""
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import contextlib
+import collections
+
+ENV_VAR = 'PMED_METRICS'
+
+
+class Metrics:
+    def __init__(self, path=None):
+        self.path = pathlib.Path(path) if path else None
+        self.enabled = bool(path)
+        self.timings = collections.Counter()
+        self.counters = collections.Counter()
+        self.values = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        self.timings.clear()
+        self.counters.clear()
+        self.values.clear()
+
+    def stage(self, name, items):
+        """
+        Instrument an iterable stage, recording the time spent in it and the number of items
+        yielded.
+        """
+        if not self.enabled:
+            return items
+        return self._iter_stage(name, items)
+
+    def _iter_stage(self, name, items):
+        items, n, elapsed = iter(items), 0, 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                n += 1
+                yield item
+        finally:
+            self.timings[name] += elapsed
+            self.counters[name + '.items'] += n
+
+    def timer(self, name):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timer(name)
+
+    @contextlib.contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+            self.counters[name + '.calls'] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def set(self, name, value):
+        """
+        Record a JSON-serializable value, e.g. a dataset statistic.
+        """
+        if self.enabled:
+            self.values[name] = value
+
+    def count_etyma(self, etyma):
+        if self.enabled:
+            self.counters['etyma'] += len(etyma)
+            self.counters['protoforms'] += sum(1 for e in etyma if e.protoform)
+            self.counters['reflexes'] += sum(len(e.reflexes) for e in etyma)
+
+    def count_patch_hits(self, hits):
+        """
+        :param hits: `Counter` of patch hits, keyed by `(table name, key)`.
+        """
+        if self.enabled:
+            for (table, _), n in hits.items():
+                self.counters['hits.' + table] += n
+
+    def asdict(self):
+        return dict(
+            timings={k: round(v, 6) for k, v in sorted(self.timings.items())},
+            counters=dict(sorted(self.counters.items())),
+            values=dict(sorted(self.values.items())))
+
+    def write(self, path=None):
+        path = pathlib.Path(path) if path else self.path
+        assert path
+        path.write_text(json.dumps(self.asdict(), indent=2), encoding='utf8')
+
+
+METRICS = Metrics(os.environ.get(ENV_VAR))
+
+
+def main(args=None):
+    from .parser import Dictionary
+    # When run with `python -m`, this module is `__main__`, so we must use the instance imported
+    # by the parser.
+    from .metrics import METRICS
+
+    parser = argparse.ArgumentParser(description='Parse the dictionary with instrumentation.')
+    parser.add_argument('pmed_txt')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(args)
+
+    METRICS.enable()
+    with METRICS.timer('Dictionary'):
+        d = Dictionary(args.pmed_txt, workers=args.workers)
+        list(d._iter_etyma())
+    if METRICS.path:
+        METRICS.write()
+    else:
+        print(json.dumps(METRICS.asdict(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
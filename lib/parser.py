@@ -16,12 +16,19 @@ on Mayan historical linguistics, however, was established by Terrence Kaufman, a
 
 """
 import re
+import sys
 import pathlib
+import weakref
 import functools
+import collections
 import dataclasses
+import concurrent.futures
 
+from .index import SubstringIndex, FuzzyIndex
 from .languoids import match_languoids
-from .lines import iter_lines, fix_blocks
+from .tokenizer import tokenize_reflex, tokenize_protoform, ETR_ERH
+from .lines import iter_lines, iter_fixed_blocks, iter_chunks, unmatched, anomaly
+from .metrics import METRICS
 
 """
 Since the etymologies (or cognate sets) are listed by semantic field,
@@ -55,26 +62,50 @@ of) entries that have a different root by =====
 sets of entries that have the same or semantically related gloss are
 bounded by xxxxx
 """
-@dataclasses.dataclass
+def intern(s):
+    """
+    Intern strings of low cardinality, like language codes, PoS tags or source codes.
+    """
+    return sys.intern(s) if s else s
+
+
+# Glosses are flyweights, shared by all objects with identical gloss. The table maps
+# `(spanish, english)` pairs to weak references, i.e. glosses no longer referenced by any parsed
+# data are dropped.
+GLOSSES = weakref.WeakValueDictionary()
+
+
+def _gloss(spanish, english):
+    res = GLOSSES.get((spanish, english))
+    if res is None:
+        res = GLOSSES[spanish, english] = Gloss(spanish, english)
+    return res
+
+
+@dataclasses.dataclass(frozen=True, slots=True, weakref_slot=True)
 class Gloss:
     spanish: str = None
     english: str = None
 
     @classmethod
     def from_string(cls, s):
-        etrerh = re.compile(r'\s*\[E(TR|RH)(,-?E(TR|RH))*]')
-        s = etrerh.sub('', s)
+        s = ETR_ERH.sub('', s)
         # FIXME: must recognize:
         sp, _, en = s.partition('//')
-        res = cls(sp.strip() or None, en.strip() or None)
+        res = _gloss(sp.strip() or None, en.strip() or None)
         assert (s.strip() == '//') or res.spanish or res.english, s
         return res
 
+    def __reduce__(self):
+        # Unpickled glosses - e.g. parsed in worker processes or loaded from the cache - are
+        # flyweights, too.
+        return _gloss, (self.spanish, self.english)
+
     def __str__(self):
         return '{}//{}'.format(self.spanish or '', self.english or '')
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Reflex:
     lang: str
     form: str = None
@@ -84,6 +115,10 @@ class Reflex:
     pos: str = None
     orig_lang: str = None
 
+    def __post_init__(self):
+        self.lang, self.source, self.pos, self.orig_lang = map(
+            intern, (self.lang, self.source, self.pos, self.orig_lang))
+
     def __str__(self):
         return '    {}{}\t{}\t{}\t{}'.format(
             self.lang,
@@ -95,103 +130,167 @@ class Reflex:
 
     @classmethod
     def from_line(cls, line):
-        # Normalize line!
-        # aj (adv?) temprano [ETR],,EARLY,,
-        line = line.replace("(+ dir)[d]estirar", "(+ dir)[d]estirar")
-        line = line.replace("vt (instr)ma", "vt (instr)  ma")
-
-        linen = re.sub(
-            r'(?P<pos>T|vt|vi|aj)\s*\(?\+\s*(?P<qual>[a-z]+)\)?\s//',
-            lambda m: '{} + {}  //'.format(m.group('pos'), m.group('qual')),
-            line)
-        linen = re.sub(
-            r'(?P<pos>T|vt|vi|aj)\s*\(?\+\s*(?P<qual>[a-z]+)\)?\s(?P<gloss>[a-z])',
-            lambda m: '{} + {}  {}'.format(m.group('pos'), m.group('qual'), m.group('gloss')),
-            linen)
-        linen = re.sub(
-            r'(?P<pos>T|vt|vi|aj):(?P<qual>[a-z/]+)\s(?P<add>\{.b\'e7}\s)?(?P<gloss>[a-z(])',
-            lambda m: '{}:{} {}  {}'.format(m.group('pos'), m.group('qual'), m.group('add') or '', m.group('gloss')),
-            linen)
-        if linen != line:
-            line = linen
-
-        # Parse the language specification:
-        lang, line = line.split(None, maxsplit=1) if re.search(r'\s', line) else (line, '')
-        lang, orig_lang = match_languoids(lang)
+        tokens = tokenize_reflex(line)
+        lang, orig_lang = match_languoids(tokens.lang)
         assert len(lang) == 1, 'reflexes must be assigned to a single variety'
-        lang = lang[0]
-
-        # Parse the source:
-        source = re.search(r'\s*\[(?P<source>[a-zA-Z0-9\-& ():*,#.?]+)]$', line)
-        if source:
-            line = line[:source.start()].strip()
-            source = source.group('source')
-
-        if re.match(r'#[a-z\-]+\s+/', line):
-            # Normalize whitespace between protoform and remainder.
-            line = '{} {}'.format(*line.split(None, maxsplit=1))
-
-        form, pos, gloss, comment = None, None, None, None
-        comps = re.split(r'\s\s+', re.sub(r'//\s\s+', '// ', line))
-        if len(comps) == 3:  # 3 multi-space separated "columns".
-            form, pos, gloss = comps  # We assume these are form, PoS and gloss ...
-            if pos.startswith('/') and pos.endswith('/'):  # ... unless PoS is part of the form ...
-                form += ' {}'.format(pos)
-                pos = None
-            elif pos.startswith('[') and pos.endswith(']'):  # ... or a comment.
-                comment = pos[1:-1].strip()
-                pos = None
-        elif len(comps) == 2:
-            form, gloss = comps
-        elif len(comps) == 1:
-            form = comps[0]
-        else:
-            raise ValueError(line)
-
         return cls(
-            lang,
-            form=form,
-            gloss=Gloss.from_string(gloss) if gloss else None,
-            source=source,
-            pos=pos,
-            comment=comment,
+            lang[0],
+            form=tokens.form,
+            gloss=Gloss.from_string(tokens.gloss) if tokens.gloss else None,
+            source=tokens.source,
+            pos=tokens.pos,
+            comment=tokens.comment,
             orig_lang=orig_lang,
         )
 
 
+def _parse_etyma(sf):
+    return sf.etyma
+
+
 class Dictionary:
-    def __init__(self, p):
-        p = pathlib.Path(p)
-        self.full_lines = list(iter_lines(fix_blocks(p.read_text(encoding='utf8')).split('\n')))
-        self.lines = [l[0] for l in self.full_lines]
-        self.semantic_fields = []
-        last_sf = None
-        for sf, subfield, chunk in self._iter_semantic_fields(self.full_lines):
-            self.semantic_fields.append(SemanticField(
-                last_sf if subfield else sf,
-                sf if subfield else None,
-                chunk,
-            ))
-            if not subfield:
-                last_sf = sf
+    def __init__(self, p, workers=None):
+        """
+        :param workers: If specified, semantic fields are parsed in parallel, using a pool of
+            `workers` processes.
+        """
+        # Hits of the fixes in `lib.lines`, keyed by `(table name, key)`:
+        self.patch_hits = collections.Counter()
+        self.semantic_fields = list(self.iter_semantic_fields(p, hits=self.patch_hits))
+        METRICS.count_patch_hits(self.patch_hits)
+        if workers and workers > 1:
+            with METRICS.timer('parser.Dictionary._parse_in_parallel'):
+                self._parse_in_parallel(workers)
+
+    def _parse_in_parallel(self, workers, fields=None):
+        # Semantic fields can be parsed independently, so we farm them out to a process pool and
+        # prime the `etyma` cached property of each field with the results - in original order.
+        fields = self.semantic_fields if fields is None else fields
+        chunksize = max(1, len(fields) // (4 * workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for sf, etyma in zip(
+                    fields, executor.map(_parse_etyma, fields, chunksize=chunksize)):
+                sf.__dict__['etyma'] = etyma
+                # Metrics recorded in the worker processes are lost, so we count in the parent.
+                METRICS.count_etyma(etyma)
+
+    @property
+    def unmatched_patches(self):
+        return unmatched(self.patch_hits)
+
+    @functools.cached_property
+    def _etyma(self):
+        return list(self._iter_etyma())
+
+    @functools.cached_property
+    def _page_index(self):
+        res = collections.defaultdict(list)
+        for etymon in self._etyma:
+            res[etymon.page].append(etymon)
+        return res
+
+    @functools.cached_property
+    def _field_index(self):
+        res = {}
+        for sf in self.semantic_fields:
+            res.setdefault(sf.main, sf)
+            if sf.sub:
+                res.setdefault(sf.sub, sf)
+        return res
+
+    @functools.cached_property
+    def _protoform_index(self):
+        return SubstringIndex([
+            etymon.protoform.form if etymon.protoform else None for etymon in self._etyma])
+
+    @functools.cached_property
+    def _forms(self):
+        # `(form, language, etymon)` triples for all protoforms and reflexes.
+        res = []
+        for etymon in self._etyma:
+            if etymon.protoform and etymon.protoform.form:
+                res.append((etymon.protoform.form, etymon.protoform.lang, etymon))
+            res.extend((r.form, r.lang, etymon) for r in etymon.reflexes if r.form)
+        return res
+
+    @functools.cached_property
+    def _form_index(self):
+        return FuzzyIndex([form for form, _, _ in self._forms])
+
+    def similar_forms(self, form, k=10, max_distance=None):
+        """
+        Search protoforms and reflexes with spelling close to `form`.
+
+        :return: `list` of up to `k` triples `(distance, form, [(language, etymon), ...])`, for
+            the (distinct) forms with the smallest Levenshtein distance to `form`.
+        """
+        return [
+            (d, match, [self._forms[i][1:] for i in positions])
+            for d, match, positions in self._form_index.search(
+                form, k=k, max_distance=max_distance)]
 
     def __getitem__(self, item):
+        """
+        Look up etyma by page number, semantic fields by (sub)field name or the first etymon with a
+        protoform containing a string.
+        """
         if isinstance(item, int):
-            return [etymon for etymon in self._iter_etyma() if etymon.page == item]
-        for sf in self.semantic_fields:
-            if sf.main == item or (sf.sub and sf.sub == item):
-                return sf
-        for etymon in self._iter_etyma():
-            if etymon.protoform and item in etymon.protoform:
-                return etymon
+            return list(self._page_index.get(item, []))
+        if item in self._field_index:
+            return self._field_index[item]
+        i = self._protoform_index.find(item)
+        if i is not None:
+            return self._etyma[i]
         raise KeyError(item)
 
     def _iter_etyma(self):
         for sf in self.semantic_fields:
             yield from sf.etyma
 
+    def iter_numbered_etyma(self):
+        """
+        Etyma are numbered in dictionary order starting with 1, i.e. the number of an etymon is the
+        ID of the corresponding cognate set in the CLDF data.
+
+        :return: generator of `(etymon_id, semantic field, etymon)` triples.
+        """
+        etymon_id = 0
+        for sf in self.semantic_fields:
+            for etymon in sf.etyma:
+                etymon_id += 1
+                yield etymon_id, sf, etymon
+
+    @classmethod
+    def iter_semantic_fields(cls, p, hits=None, anomalies=None):
+        """
+        Stream the semantic fields of the dictionary in text file `p`.
+
+        Lines are read, fixed and grouped lazily, i.e. only the lines of the current semantic field
+        are kept in memory.
+
+        :param anomalies: If a `list` is passed, anomalies in the text are collected in it rather
+            than raising an `AssertionError`.
+        """
+        last_sf = None
+        blocks = METRICS.stage(
+            'lines.iter_fixed_blocks',
+            iter_fixed_blocks(iter_chunks(pathlib.Path(p)), hits=hits, anomalies=anomalies))
+        lines = METRICS.stage('lines.iter_lines', iter_lines(blocks, hits=hits, anomalies=anomalies))
+        for sf, subfield, chunk in METRICS.stage(
+                'parser.iter_semantic_fields', cls._iter_semantic_fields(lines, anomalies)):
+            yield SemanticField(
+                last_sf if subfield else sf,
+                sf if subfield else None,
+                chunk,
+            )
+            if not subfield:
+                last_sf = sf
+        # The etymologies end before the text does, so we consume the rest of the text to make
+        # `iter_fixed_blocks` check whether all BLOCKS matched.
+        collections.deque(blocks, maxlen=0)
+
     @staticmethod
-    def _iter_semantic_fields(lines):
+    def _iter_semantic_fields(lines, anomalies=None):
         sf_title_pattern = re.compile(r'(?P<subfield>\s+)?%%?\s+(?P<title>[^%]+)%%?')
         sf_frame_pattern = re.compile(r'\s*%%%%[%]+')
 
@@ -209,11 +308,13 @@ class Dictionary:
                 subfield = bool(m.group('subfield'))
                 continue
             chunk.append((line, page, lineno))
-        assert sf, chunk
+        if not sf:
+            anomaly(anomalies, 'no-semantic-field', str(chunk[:1]), message=str(chunk))
+            return
         yield sf, subfield, chunk
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Concept:
     name: str
     species: str = None
@@ -234,7 +335,7 @@ class SemanticField:
     sub: str
     lines: list
 
-    def iter_concepts(self):
+    def iter_concepts(self, anomalies=None):
         """
         > sets of entries that have the same or semantically related gloss are bounded by xxxxx
         """
@@ -250,41 +351,79 @@ class SemanticField:
             if line.startswith('        '):
                 match = concept_pattern.fullmatch(line.strip())
                 if match:
-                    assert not [l for l, _, _ in lines if l.strip()], (
-                        'non-empty lines before concept {}'.format(line.strip()))
+                    if [l for l, _, _ in lines if l.strip()]:
+                        # We keep the lines with the preceding concept.
+                        anomaly(
+                            anomalies, 'lines-before-concept', line.strip(), page, lineno,
+                            'non-empty lines before concept {}'.format(line.strip()))
+                        yield concept, lines
+                        lines = []
                     concept = Concept(**match.groupdict())
                     continue
             lines.append((line, page, lineno))
-        assert lines
+        if not lines:
+            page, lineno = self.lines[-1][1:] if self.lines else (None, None)
+            anomaly(anomalies, 'empty-concept', str(concept), page, lineno)
+            return
         yield concept, lines
 
     @functools.cached_property
     def etyma(self):
-        def iter_reflexes(lines):
-            witness = None
+        return self.parse()
+
+    def parse(self, anomalies=None):
+        """
+        :param anomalies: If a `list` is passed, entries which cannot be parsed are skipped,
+            collecting anomalies in the list, rather than raising an exception.
+        :return: `list` of `Etymon` instances.
+        """
+        def iter_reflexes(lines, page, lineno):
+            witness, failed = None, False
             for i, line in enumerate(lines):
                 line = line.strip()
                 if not line:
                     continue
                 if line.startswith('['):  # Comments are assigned to the preceding reflex.
-                    assert witness, line
-                    witness.comment = line[1:-1].strip()
+                    if witness:
+                        witness.comment = line[1:-1].strip()
+                    elif not failed:
+                        anomaly(anomalies, 'orphaned-comment', line, page, lineno, line)
                 else:
                     if witness:
                         yield witness
-                    witness = Reflex.from_line(line)
+                    witness = _parse(Reflex.from_line, anomalies, 'reflex', line, page, lineno)
+                    failed = witness is None
             if witness:
                 yield witness
 
         res = []
-        for concept, lines in self.iter_concepts():
-            for concept, protoform, witnesses, comments, page, line in iter_etyma(lines):
-                witnesses = list(iter_reflexes(witnesses))
-                res.append(Etymon.from_data(concept, protoform, witnesses, comments, page, line))
+        with METRICS.timer('parser.SemanticField.etyma'):
+            for concept, lines in self.iter_concepts(anomalies):
+                for concept, protoform, witnesses, comments, page, line in iter_etyma(
+                        lines, anomalies=anomalies):
+                    witnesses = list(iter_reflexes(witnesses, page, line))
+                    etymon = _parse(
+                        lambda pf: Etymon.from_data(concept, pf, witnesses, comments, page, line),
+                        anomalies, 'protoform', protoform, page, line)
+                    if etymon:
+                        res.append(etymon)
+        METRICS.count_etyma(res)
         return res
 
 
-@dataclasses.dataclass
+def _parse(func, anomalies, rule, line, page, lineno):
+    """
+    In validation mode, i.e. if `anomalies` is a `list`, parse errors are recorded, returning `None`.
+    """
+    if anomalies is None:
+        return func(line)
+    try:
+        return func(line)
+    except Exception as e:
+        anomaly(anomalies, rule, line, page, lineno, '{}: {}'.format(type(e).__name__, e))
+
+
+@dataclasses.dataclass(slots=True)
 class Protoform:
     lang: str
     form: str
@@ -294,6 +433,9 @@ class Protoform:
     number: str = None
     orig_lang: str = None
 
+    def __post_init__(self):
+        self.lang, self.pos, self.orig_lang = map(intern, (self.lang, self.pos, self.orig_lang))
+
     def __str__(self):
         return '{}{}\t{}'.format(
             self.lang,
@@ -303,95 +445,14 @@ class Protoform:
 
     @classmethod
     def from_line(cls, protoform):
-        def repl_apos(s):
-            for k, v in [("man's", "man__s"), ("mother's", "mother__s")]:
-                s = s.replace(k, v)
-            return s
-
-        def repl_underscore(s):
-            for k, v in [("man's", "man__s"), ("mother's", "mother__s")]:
-                s = s.replace(v, k)
-            return s
-
-        # Parse langspec:
-        orig = None
-        if protoform.startswith('*') or protoform.startswith('#'):
-            langspec = None
-        elif re.search(r'\s', protoform):
-            langspec, protoform = protoform.split(None, maxsplit=1)
-        else:
-            langspec, protoform = protoform, None
+        tokens = tokenize_protoform(protoform)
+        langspec, orig = tokens.lang, None
         if langspec:
             res, orig = match_languoids(langspec)
             assert res
             langspec = '+'.join(res)
-
-        comment, gloss, source, number, pos = [], [], None, None, None
-
-        # Parse gloss:
-        if protoform:
-            protoform = repl_apos(protoform)
-            # "STUFF" = `stuff';
-            match = re.search(r'"(?P<g1>[^"]+)"(\s*(=\s*)?`(?P<g2>[^\']+)\')?;?', protoform)
-            if match:
-                gloss.append(match.group('g1'))
-                if match.group('g2'):
-                    gloss.append(match.group('g2'))
-                protoform = protoform[:match.start()] + protoform[match.end():]
-                if not match.group('g2'):
-                    match = re.search(r' = (?P<g2>[a-z]+( [a-z]+)*)', protoform)
-                    if match:
-                        gloss.append(match.group('g2'))
-                        protoform = protoform[:match.start()] + protoform[match.end():]
-                protoform = protoform.lstrip(' ')
-
-            match = re.search(r'`(?P<g>[^\']+)\'(\s+\((?P<spec>[^)]+)\))?', protoform)
-            if match:
-                assert not gloss, protoform
-                gloss.append(match.group('g'))
-                if match.group('spec'):
-                    gloss.append(match.group('spec'))
-                protoform = protoform[:match.start()] + protoform[match.end():]
-
-            if gloss:
-                gloss = [repl_underscore(gl) for gl in gloss]
-            protoform = repl_underscore(protoform)
-
-            while '[' in protoform:
-                protoform, _, inbraces = protoform.partition('[')
-                inbraces, _, rem = inbraces.partition(']')
-                protoform += rem
-                if inbraces in {'1', '2'}:
-                    number = inbraces
-                    protoform = protoform.rstrip(' ')
-                elif 'TK' in inbraces:
-                    assert not source
-                    source = inbraces
-                else:
-                    comment.append(inbraces)
-
-            pf, ingloss = '', False
-            for s in re.split(r'(\s\s+)', protoform):
-                if '//' in s:
-                    ingloss = True
-                if ingloss:
-                    if s.strip():
-                        gloss.append(s.strip())
-                else:
-                    pf += s
-            protoform = pf.strip()
-
-            for i, ss in enumerate(re.split(r'\s\s+', protoform)):
-                if i == 0:
-                    protoform = ss
-                elif ss in {
-                    "vt", "vi", "vt > passive", "vi < P",
-                    "s", "P", "sv", "dir", "num",
-                    "aj", "aj < P", "a(P)",
-                    "reflexive pronoun"}:
-                    pos = ss
-                else:
-                    gloss.append(ss)
+        protoform, pos, gloss, comment, number = \
+            tokens.form, tokens.pos, tokens.gloss, tokens.comment, tokens.number
 
         gloss = Gloss.from_string('; '.join(gloss)) if '; '.join(gloss).strip() else None
         #clean_gloss = []
@@ -411,7 +472,7 @@ class Protoform:
         return cls(langspec, protoform, gloss, pos, '; '.join(comment), number, orig_lang=orig)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Etymon:
     concept: Concept
     protoform: str
@@ -439,7 +500,7 @@ class Etymon:
         return '\n'.join(res + [''])
 
 
-def iter_etyma(lines, rootid=0):
+def iter_etyma(lines, rootid=0, anomalies=None):
     """
 [A-Z0-9,./-;]
 
@@ -480,10 +541,14 @@ def iter_etyma(lines, rootid=0):
                 cfwitnesses.append(line)
             else:
                 if line.strip().startswith('['):  # a witness comment
-                    assert line.strip().endswith(']'), line
+                    if not line.strip().endswith(']'):
+                        anomaly(anomalies, 'unterminated-comment', line, page, lineno, line)
+                        continue
                 else:
-                    langs, _ = match_languoids(line.strip().split()[0])
-                    assert langs and len(langs) == 1, line.strip()
+                    langs = match_languoids(line.strip().split()[0])
+                    if not (langs and len(langs[0]) == 1):
+                        anomaly(anomalies, 'reflex-language', line, page, lineno, line.strip())
+                        continue
                 witnesses.append(line)
             continue
 
@@ -510,8 +575,10 @@ def iter_etyma(lines, rootid=0):
             concept, witnesses, comments, cfwitnesses, cf = None, [], [], [], False
             protoform = line
         elif line.startswith('['):
-            assert line.endswith(']')
-            comments.append(line[1:-1].strip())
+            if line.endswith(']'):
+                comments.append(line[1:-1].strip())
+            else:
+                anomaly(anomalies, 'unterminated-comment', line, page, lineno)
         elif line.startswith('cf. '):  # a "see also" witness
             cfwitnesses.append(line)
         elif line == 'cf.':
@@ -525,8 +592,11 @@ def iter_etyma(lines, rootid=0):
         else:
             # its to (in)
             m = re.fullmatch(r'"?([A-Z0-9]+|to)(\s+([A-Z\-0-9]+|its|of|to|\(in\)|\+))*"?(\s+(=\s+)?`?[a-z/, ]+\'?)?', line)
-            assert len(line) > 5 and m, '{}: {}'.format(lineno, line)
-            concept = Concept(name=line)
+            if len(line) > 5 and m:
+                concept = Concept(name=line)
+            else:
+                anomaly(anomalies, 'unrecognized-line', line, page, lineno,
+                        '{}: {}'.format(lineno, line))
 
     if witnesses:
         yield concept, protoform, witnesses, comments, start_page, start_lineno
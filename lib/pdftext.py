@@ -0,0 +1,137 @@
+"""
+Page-parallel, cached conversion of the PMED PDF to text with `pdftotext -layout -nopgbrk`.
+
+The PDF is converted in page ranges (`pdftotext -f FIRST -l LAST`), run concurrently. Ranges are
+converted with page breaks, i.e. with a form feed after each page, so the output can be split into
+pages, which are cached - keyed by the hash of the PDF and the page number. Concatenating the pages
+without the form feeds yields exactly the output of `pdftotext -layout -nopgbrk` for the whole PDF.
+
+Usage:
+    python -m lib.pdftext [--cache-dir DIR] [--workers N] PDF OUTPUT
+"""
+import os
+import re
+import pathlib
+import argparse
+import subprocess
+import concurrent.futures
+
+from .cache import file_hash
+
+PAGES_PER_JOB = 16
+
+
+def page_count(pdf, pdfinfo='pdfinfo'):
+    out = subprocess.check_output([pdfinfo, str(pdf)]).decode('utf8', errors='replace')
+    m = re.search(r'^Pages:\s+(?P<n>[0-9]+)\s*$', out, flags=re.MULTILINE)
+    assert m, out
+    return int(m.group('n'))
+
+
+def extract_pages(pdf, first, last, pdftotext='pdftotext'):
+    """
+    :return: `list` of the texts of pages `first` to `last` (inclusive), as `bytes`.
+    """
+    out = subprocess.check_output([
+        pdftotext, '-layout', '-f', str(first), '-l', str(last), str(pdf), '-'])
+    pages = out.split(b'\f')
+    # Each page is terminated with a form feed:
+    assert len(pages) == last - first + 2 and not pages[-1], (first, last, len(pages))
+    return pages[:-1]
+
+
+def iter_ranges(pages, size):
+    """
+    Split a sorted list of page numbers into ranges of consecutive pages of at most `size` pages.
+    """
+    first = last = None
+    for page in pages:
+        if first is not None and (page != last + 1 or last - first + 1 == size):
+            yield first, last
+            first = None
+        if first is None:
+            first = page
+        last = page
+    if first is not None:
+        yield first, last
+
+
+class PageCache:
+    def __init__(self, directory, pdf):
+        self.directory = pathlib.Path(directory) / file_hash(pdf).hexdigest()
+
+    def _path(self, page):
+        return self.directory / '{:05d}.txt'.format(page)
+
+    def __contains__(self, page):
+        return self._path(page).exists()
+
+    def __getitem__(self, page):
+        return self._path(page).read_bytes()
+
+    def __setitem__(self, page, text):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(page).with_suffix('.tmp')
+        tmp.write_bytes(text)
+        tmp.replace(self._path(page))
+
+
+def pdf_to_text(
+        pdf,
+        output,
+        cache_dir=None,
+        workers=None,
+        pages_per_job=PAGES_PER_JOB,
+        pdftotext='pdftotext',
+        pdfinfo='pdfinfo',
+        log=None):
+    """
+    Convert `pdf` to text, writing the result to `output`.
+
+    :param cache_dir: Directory to cache converted pages in. If `None`, no caching is done.
+    :param workers: Maximal number of concurrent `pdftotext` processes.
+    :return: pair (number of pages, number of pages which had to be converted).
+    """
+    workers = workers or os.cpu_count() or 1
+    npages = page_count(pdf, pdfinfo=pdfinfo)
+    cache = PageCache(cache_dir, pdf) if cache_dir else {}
+    missing = [page for page in range(1, npages + 1) if page not in cache]
+    if missing:
+        # Make sure there's at least one job per worker:
+        size = max(1, min(pages_per_job, -(-len(missing) // workers)))
+        # `pdftotext` runs in subprocesses, so threads are enough to run conversions in parallel.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = {
+                executor.submit(extract_pages, pdf, first, last, pdftotext=pdftotext): first
+                for first, last in iter_ranges(missing, size)}
+            for job in concurrent.futures.as_completed(jobs):
+                for page, text in enumerate(job.result(), start=jobs[job]):
+                    cache[page] = text
+        if log:
+            log.info('converted {} of {} pages'.format(len(missing), npages))
+
+    with pathlib.Path(output).open('wb') as f:
+        for page in range(1, npages + 1):
+            f.write(cache[page])
+    return npages, len(missing)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Convert the PMED PDF to text.')
+    parser.add_argument('pdf')
+    parser.add_argument('output')
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--pages-per-job', type=int, default=PAGES_PER_JOB)
+    args = parser.parse_args(args)
+    npages, converted = pdf_to_text(
+        args.pdf,
+        args.output,
+        cache_dir=args.cache_dir,
+        workers=args.workers,
+        pages_per_job=args.pages_per_job)
+    print('{} pages, {} converted'.format(npages, converted))
+
+
+if __name__ == '__main__':
+    main()
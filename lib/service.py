@@ -0,0 +1,291 @@
+"""
+A read-only HTTP/JSON query service over a parsed `Dictionary`, built on `asyncio` streams.
+
+The dictionary is parsed (or loaded from a `ParseCache`) and fully indexed before the server
+starts accepting connections: all lazily computed state - `SemanticField.etyma`, the JSON
+representations of etyma and reflexes and the indexes over them - is computed up-front and never
+mutated afterwards, so the objects can be shared by all requests without locking.
+
+Endpoints (all `GET`, responding with JSON; `limit` restricts the number of results, default 100):
+
+    /page/<n>              etyma on page n
+    /field/<name>          etyma of a semantic field or subfield
+    /protoform?q=<s>       etyma with a protoform containing s
+    /reflex?q=<s>          reflexes with a form containing s
+    /language/<code>       reflexes in the languoid with ID code
+    /gloss?q=<s>           reflexes and protoforms with a gloss containing s (case-insensitive)
+    /etymon/<id>           etymon by ID (i.e. the ID of the cognate set in the CLDF data)
+    /stats                 number of requests and latency percentiles per endpoint
+
+Usage:
+    python -m lib.service [--host HOST] [--port PORT] [--cache-dir DIR] PMED_TXT
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import functools
+import collections
+import urllib.parse
+
+from .index import SubstringIndex, DistinctSubstringIndex
+
+DEFAULT_LIMIT = 100
+LATENCY_SAMPLES = 10000  # Number of most recent latencies per endpoint used for percentiles.
+PERCENTILES = [50, 90, 99]
+RESPONSE_CACHE_SIZE = 4096
+MAX_BODY_SIZE = 2 ** 16  # Larger request bodies are not read, but the connection is closed.
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def _gloss(gloss):
+    return str(gloss) if gloss else None
+
+
+def etymon_json(etymon_id, sf, etymon):
+    p = etymon.protoform
+    return dict(
+        id=etymon_id,
+        semantic_field=sf.main,
+        semantic_subfield=sf.sub,
+        page=etymon.page,
+        line=etymon.line,
+        concept=str(etymon.concept) if etymon.concept else None,
+        protoform=dict(
+            lang=p.lang, form=p.form, pos=p.pos, gloss=_gloss(p.gloss), comment=p.comment or None,
+        ) if p else None,
+        reflexes=[reflex_json(etymon_id, r) for r in etymon.reflexes],
+        comments=etymon.comments,
+    )
+
+
+def reflex_json(etymon_id, reflex):
+    return dict(
+        etymon_id=etymon_id,
+        lang=reflex.lang,
+        form=reflex.form,
+        pos=reflex.pos,
+        gloss=_gloss(reflex.gloss),
+        source=reflex.source,
+        comment=reflex.comment,
+    )
+
+
+class Backend:
+    """
+    Indexes of a `Dictionary`, answering queries with JSON-serializable objects.
+    """
+    def __init__(self, dictionary):
+        self.etyma = []  # JSON objects of etyma, in dictionary order.
+        self.reflexes = []  # JSON objects of reflexes, in dictionary order.
+        self.pages = collections.defaultdict(list)
+        self.fields = collections.defaultdict(list)
+        self.languages = collections.defaultdict(list)
+        for etymon_id, sf, etymon in dictionary.iter_numbered_etyma():
+            obj = etymon_json(etymon_id, sf, etymon)
+            self.etyma.append(obj)
+            self.reflexes.extend(obj['reflexes'])
+            self.pages[etymon.page].append(obj)
+            self.fields[sf.main].append(obj)
+            if sf.sub:
+                self.fields[sf.sub].append(obj)
+            for r in obj['reflexes']:
+                self.languages[r['lang']].append(r)
+        self.protoform_index = SubstringIndex(
+            [e['protoform']['form'] if e['protoform'] else None for e in self.etyma])
+        self.reflex_index = DistinctSubstringIndex([r['form'] for r in self.reflexes])
+        self.protoform_gloss_index = DistinctSubstringIndex([
+            e['protoform']['gloss'].lower() if e['protoform'] and e['protoform']['gloss'] else None
+            for e in self.etyma])
+        self.reflex_gloss_index = DistinctSubstringIndex(
+            [r['gloss'].lower() if r['gloss'] else None for r in self.reflexes])
+
+    def page(self, page):
+        return self.pages.get(int(page), [])
+
+    def field(self, name):
+        return self.fields.get(name, [])
+
+    def etymon(self, etymon_id):
+        etymon_id = int(etymon_id)
+        if 1 <= etymon_id <= len(self.etyma):
+            return self.etyma[etymon_id - 1]
+        raise KeyError(etymon_id)
+
+    def protoform(self, q):
+        return [self.etyma[i] for i in self.protoform_index.find_all(q)]
+
+    def reflex(self, q):
+        return [self.reflexes[i] for i in self.reflex_index.find_all(q)]
+
+    def language(self, code):
+        return self.languages.get(code, [])
+
+    def gloss(self, q, limit=None):
+        q = q.lower()
+        return dict(
+            protoforms=[self.etyma[i] for i in self.protoform_gloss_index.find_all(q)][:limit],
+            reflexes=[self.reflexes[i] for i in self.reflex_gloss_index.find_all(q)][:limit])
+
+
+class Latencies:
+    def __init__(self):
+        self.samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+        self.counts = collections.Counter()
+
+    def add(self, endpoint, seconds):
+        self.samples[endpoint].append(seconds)
+        self.counts[endpoint] += 1
+
+    def stats(self):
+        res = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            res[endpoint] = dict(
+                count=self.counts[endpoint],
+                max_ms=samples[-1] * 1000,
+                **{
+                    'p{}_ms'.format(p): samples[len(samples) * p // 100] * 1000
+                    for p in PERCENTILES})
+        return res
+
+
+def _json(obj):
+    return json.dumps(obj).encode('utf8')
+
+
+class Service:
+    def __init__(self, backend, cache_size=RESPONSE_CACHE_SIZE):
+        self.backend = backend
+        self.latencies = Latencies()
+        # Since the data is read-only, responses - except for /stats - can be cached.
+        self._cached_respond = functools.lru_cache(maxsize=cache_size)(self._respond)
+
+    def route(self, path, query):
+        """
+        :return: pair (endpoint name, JSON-serializable result).
+        """
+        comps = [urllib.parse.unquote(c) for c in path.strip('/').split('/')]
+        endpoint, args = comps[0], comps[1:]
+        limit = int(query.get('limit', DEFAULT_LIMIT))
+        if endpoint == 'stats' and not args:
+            return endpoint, self.latencies.stats()
+        if endpoint == 'etymon' and len(args) == 1:
+            return endpoint, self.backend.etymon(args[0])
+        if endpoint in {'page', 'field', 'language'} and len(args) == 1:
+            return endpoint, getattr(self.backend, endpoint)(args[0])[:limit]
+        if endpoint in {'protoform', 'reflex'} and not args and query.get('q'):
+            return endpoint, getattr(self.backend, endpoint)(query['q'])[:limit]
+        if endpoint == 'gloss' and not args and query.get('q'):
+            return endpoint, self.backend.gloss(query['q'], limit=limit)
+        raise KeyError(path)
+
+    def respond(self, method, target):
+        """
+        :return: triple (endpoint name, HTTP status code, JSON-encoded body as `bytes`)
+        """
+        if method != 'GET':
+            return 'invalid', 405, _json(dict(error='method not allowed'))
+        if urllib.parse.urlsplit(target).path.strip('/') == 'stats':
+            return self._respond(target)
+        return self._cached_respond(target)
+
+    def _respond(self, target):
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            endpoint, res = self.route(url.path, query)
+            return endpoint, 200, _json(res)
+        except (KeyError, IndexError):
+            return 'invalid', 404, _json(dict(error='not found'))
+        except ValueError:
+            return 'invalid', 400, _json(dict(error='bad request'))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                start = time.perf_counter()
+                lines = head.decode('latin1').split('\r\n')
+                request_line, headers = lines[0].split(), {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        k, _, v = line.partition(':')
+                        headers[k.strip().lower()] = v.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                # Request bodies are ignored. Bodies of known length are read and discarded, so the
+                # next request on the connection can be read. Since only GET requests are answered
+                # and bodies of unknown length can't be skipped, the connection is closed
+                # otherwise.
+                close = headers.get('connection', '').lower() == 'close' or \
+                    len(request_line) != 3 or \
+                    request_line[2] == 'HTTP/1.0' or \
+                    request_line[0] != 'GET' or \
+                    'transfer-encoding' in headers or \
+                    not 0 <= length <= MAX_BODY_SIZE
+                if 0 < length <= MAX_BODY_SIZE:
+                    try:
+                        await reader.readexactly(length)
+                    except asyncio.IncompleteReadError:
+                        break
+                if len(request_line) != 3:
+                    endpoint, status, body = 'invalid', 400, _json(dict(error='bad request'))
+                else:
+                    endpoint, status, body = self.respond(*request_line[:2])
+                writer.write(
+                    'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+                    'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                        status, STATUS[status], len(body), 'close' if close else 'keep-alive',
+                    ).encode('latin1') + body)
+                await writer.drain()
+                self.latencies.add(endpoint, time.perf_counter() - start)
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080, log=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        if log:
+            log.write('serving on {}\n'.format(
+                ', '.join('{}:{}'.format(*s.getsockname()[:2]) for s in server.sockets)))
+        async with server:
+            await server.serve_forever()
+
+
+def main(args=None):
+    from .parser import Dictionary
+    from .cache import ParseCache
+
+    parser = argparse.ArgumentParser(description='Serve the dictionary over HTTP.')
+    parser.add_argument('pmed_txt')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument(
+        '--cache-dir', default=None, help='Load the parsed dictionary from this ParseCache')
+    args = parser.parse_args(args)
+
+    if args.cache_dir:
+        dictionary, _ = ParseCache(args.cache_dir).load(args.pmed_txt)
+    else:
+        dictionary = Dictionary(args.pmed_txt)
+    service = Service(Backend(dictionary))
+    try:
+        asyncio.run(service.serve(args.host, args.port, log=sys.stderr))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
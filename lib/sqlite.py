@@ -0,0 +1,189 @@
+"""
+Export of a parsed `Dictionary` to an indexed SQLite database.
+
+Etyma are numbered in dictionary order starting with 1, i.e. `etymon.id` is the ID of the
+corresponding cognate set in the CLDF data.
+
+Usage:
+    python -m lib.sqlite PMED_TXT DB
+    python -m lib.sqlite --query SQL DB
+
+E.g. all reflexes in CHJ of pM etyma in a semantic field:
+
+    SELECT r.form, g.text
+    FROM reflex AS r
+    JOIN etymon AS e ON r.etymon_id = e.id
+    JOIN protoform AS p ON p.etymon_id = e.id
+    JOIN semantic_field AS sf ON e.semantic_field_id = sf.id
+    LEFT JOIN gloss AS g ON r.gloss_id = g.id
+    WHERE r.lang = 'CHJ' AND p.lang = 'pM' AND sf.main = 'NATURE'
+"""
+import sys
+import sqlite3
+import pathlib
+import argparse
+
+from .languoids import LANGUOIDS
+
+SCHEMA = """
+CREATE TABLE languoid (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    glottocode TEXT,
+    type TEXT,
+    comment TEXT
+);
+CREATE TABLE semantic_field (
+    id INTEGER PRIMARY KEY,
+    main TEXT NOT NULL,
+    sub TEXT
+);
+CREATE TABLE gloss (
+    id INTEGER PRIMARY KEY,
+    spanish TEXT,
+    english TEXT,
+    text TEXT NOT NULL
+);
+CREATE TABLE etymon (
+    id INTEGER PRIMARY KEY,
+    semantic_field_id INTEGER NOT NULL REFERENCES semantic_field(id),
+    concept TEXT,
+    comment TEXT,
+    page INTEGER,
+    line INTEGER
+);
+CREATE TABLE protoform (
+    id INTEGER PRIMARY KEY,
+    etymon_id INTEGER NOT NULL REFERENCES etymon(id),
+    lang TEXT,
+    orig_lang TEXT,
+    form TEXT,
+    pos TEXT,
+    gloss_id INTEGER REFERENCES gloss(id),
+    comment TEXT,
+    number TEXT
+);
+CREATE TABLE reflex (
+    id INTEGER PRIMARY KEY,
+    etymon_id INTEGER NOT NULL REFERENCES etymon(id),
+    lang TEXT NOT NULL REFERENCES languoid(id),
+    orig_lang TEXT,
+    form TEXT,
+    pos TEXT,
+    gloss_id INTEGER REFERENCES gloss(id),
+    source TEXT,
+    comment TEXT
+);
+"""
+# Indexes are created after the bulk inserts, which is faster than updating them for each row.
+INDEXES = """
+CREATE INDEX etymon_semantic_field ON etymon(semantic_field_id);
+CREATE INDEX etymon_page ON etymon(page);
+CREATE INDEX protoform_etymon ON protoform(etymon_id);
+CREATE INDEX protoform_lang ON protoform(lang);
+CREATE INDEX protoform_form ON protoform(form);
+CREATE INDEX protoform_gloss ON protoform(gloss_id);
+CREATE INDEX reflex_etymon ON reflex(etymon_id);
+CREATE INDEX reflex_lang ON reflex(lang);
+CREATE INDEX reflex_form ON reflex(form);
+CREATE INDEX reflex_gloss ON reflex(gloss_id);
+CREATE INDEX gloss_text ON gloss(text);
+CREATE INDEX gloss_spanish ON gloss(spanish);
+CREATE INDEX gloss_english ON gloss(english);
+CREATE INDEX semantic_field_main ON semantic_field(main);
+"""
+
+
+def write(dictionary, db):
+    """
+    Write `dictionary` to a new SQLite database `db` - replacing an existing file.
+    """
+    db = pathlib.Path(db)
+    if db.exists():
+        db.unlink()
+
+    sfids, glosses = {}, {}
+    etyma, protoforms, reflexes = [], [], []
+
+    def gloss_id(gloss):
+        if gloss is None:
+            return None
+        return glosses.setdefault(gloss, len(glosses) + 1)
+
+    for etymon_id, sf, etymon in dictionary.iter_numbered_etyma():
+        sfid = sfids.setdefault(id(sf), (len(sfids) + 1, sf))[0]
+        etyma.append((
+            etymon_id,
+            sfid,
+            str(etymon.concept) if etymon.concept else None,
+            '\n'.join(etymon.comments) or None,
+            etymon.page,
+            etymon.line))
+        p = etymon.protoform
+        if p:
+            protoforms.append((
+                etymon_id, p.lang, p.orig_lang, p.form, p.pos, gloss_id(p.gloss),
+                p.comment or None, p.number))
+        for r in etymon.reflexes:
+            reflexes.append((
+                etymon_id, r.lang, r.orig_lang, r.form, r.pos, gloss_id(r.gloss), r.source,
+                r.comment))
+
+    conn = sqlite3.connect(str(db))
+    try:
+        # We write a new file from scratch, so there's nothing to protect with a journal.
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA)
+        with conn:  # A single transaction for all inserts.
+            conn.executemany(
+                'INSERT INTO languoid VALUES (?, ?, ?, ?, ?)',
+                [(r['ID'], r['Name'], r['Glottocode'] or None, r['Type'] or None,
+                  r['Comment'] or None) for r in LANGUOIDS.values()])
+            conn.executemany(
+                'INSERT INTO semantic_field VALUES (?, ?, ?)',
+                [(i, sf.main, sf.sub) for i, sf in sfids.values()])
+            conn.executemany(
+                'INSERT INTO gloss VALUES (?, ?, ?, ?)',
+                [(i, g.spanish, g.english, str(g)) for g, i in glosses.items()])
+            conn.executemany('INSERT INTO etymon VALUES (?, ?, ?, ?, ?, ?)', etyma)
+            conn.executemany(
+                'INSERT INTO protoform (etymon_id, lang, orig_lang, form, pos, gloss_id, comment, '
+                'number) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                protoforms)
+            conn.executemany(
+                'INSERT INTO reflex (etymon_id, lang, orig_lang, form, pos, gloss_id, source, '
+                'comment) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                reflexes)
+        conn.executescript(INDEXES)
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return db
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Export the dictionary to SQLite.')
+    parser.add_argument('pmed_txt', nargs='?', default=None)
+    parser.add_argument('db')
+    parser.add_argument('--query', default=None, help='SQL query to run against DB')
+    args = parser.parse_args(args)
+
+    if args.query:
+        conn = sqlite3.connect(str(args.db))
+        try:
+            for row in conn.execute(args.query):
+                print('\t'.join('' if v is None else str(v) for v in row))
+        finally:
+            conn.close()
+        return 0
+
+    from .parser import Dictionary
+
+    assert args.pmed_txt, 'PMED_TXT is required for export'
+    print(write(Dictionary(args.pmed_txt), args.db))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
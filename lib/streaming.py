@@ -0,0 +1,61 @@
+"""
+Streaming export of CLDF tables.
+
+A CLDF writer collects rows in `writer.objects` - a `dict` mapping table names to lists of rows -
+and only writes them to disk when the writer context is exited. Replacing these lists with
+`RowSpool` objects makes rows go to disk (a temporary file) as soon as they are added, and when
+the writer writes the table at exit, the rows are streamed back from disk.
+"""
+import pickle
+import tempfile
+
+
+class RowSpool:
+    """
+    A list-like container for rows, which are pickled to a temporary file upon `append`.
+
+    Iteration (which may happen repeatedly) reads the rows back from the file. Rows must not be
+    appended while iterating.
+    """
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._len = 0
+
+    def append(self, row):
+        # Each row is pickled separately, so no memo of already pickled objects is kept.
+        pickle.dump(row, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._len += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        self._file.flush()
+        pos = self._file.tell()
+        self._file.seek(0)
+        try:
+            for _ in range(self._len):
+                yield pickle.load(self._file)
+        finally:
+            self._file.seek(pos)
+
+    def close(self):
+        self._file.close()
+
+
+def spool_tables(writer, *tables):
+    """
+    Make `writer` spool rows of `tables` to disk.
+
+    :return: `dict` mapping table names to `RowSpool` instances.
+    """
+    res = {}
+    for table in tables:
+        res[table] = RowSpool()
+        res[table].extend(writer.objects.get(table, []))
+        writer.objects[table] = res[table]
+    return res
@@ -0,0 +1,206 @@
+"""
+Generator for synthetic text in the layout of `raw/pmed.txt` - i.e. the output of
+`pdftotext -layout -nopgbrk` for the PMED - for testing and load testing the parser.
+
+At scale 1, the corpus has about as many etyma and reflexes as the real dictionary. All BLOCKS
+are included (since `iter_fixed_blocks` requires them) and - optionally - the text fixed by
+SUBSTITUTIONS, LINES and CONTINUATION_LINES.
+
+Usage:
+    python -m lib.synthetic [--scale 1] [--seed 1] [--no-fixes] OUTPUT
+"""
+import random
+import pathlib
+import argparse
+import collections
+
+from .lines import BLOCKS, SUBSTITUTIONS, LINES, CONTINUATION_LINES, substitute
+from .languoids import LANGUOIDS
+
+PAGE_FOOTER = '{}        Kaufman: preliminary Mayan Etymological Dictionary'
+LINES_PER_PAGE = 60
+ETYMA_PER_FIELD = 100
+ETYMA = 3000  # Number of etyma at scale 1.
+FRAME = 73 * '%'
+CONCEPTS_SEPARATOR = 73 * 'x'
+ETYMA_SEPARATOR = 73 * '='
+
+SYLLABLES = [
+    "ka", "ab'", "ch'o", "tz'i", "q'a", "7a", "xu", "b'a", "nh", "ty'e", "lu", "wi", "mo", "ja7",
+    "k'in", "tze", "ixi", "ul", "oo", "pa"]
+GLOSSES = [
+    ('miel', 'honey'), ('casa', 'house'), ('perro', 'dog'), ('piedra', 'stone'),
+    ('agua', 'water'), ('hombre', 'man'), ('mujer', 'woman'), ('sol', 'sun'), ('luna', 'moon'),
+    ('fuego', 'fire'), ('ceniza', 'ashes'), ('hueso', 'bone'), ('mano', 'hand'), ('pie', 'foot'),
+    ('comer', 'to eat'), ('dormir', 'to sleep'), ('grande', 'big'), ('rojo', 'red')]
+SOURCES = ['tk', 'OKMA', 'TK71', 'rml', 'gm', 'a', 'ppb', 'tk 67-68']
+POS = ['s', 'vt', 'vi', 'aj', 'sv', 'num']
+SPECIES = ['Pouteria mammosa', 'Manilkara achras', 'Solanum spp.', 'Ficus spp.']
+
+
+class Corpus:
+    def __init__(self, scale=1, seed=1, with_fixes=True):
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.with_fixes = with_fixes
+        self.proto = sorted(k for k, r in LANGUOIDS.items() if r['Type'] == 'proto language')
+        self.proto_groups = sorted(k for k in LANGUOIDS if '+' in k)
+        self.modern = sorted(k for k, r in LANGUOIDS.items() if r['Type'] in {'language', 'dialect'})
+
+    def word(self):
+        return ''.join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(1, 3)))
+
+    def gloss(self):
+        return '{} // {}'.format(*self.rng.choice(GLOSSES))
+
+    def protoform(self):
+        rng = self.rng
+        lang = rng.choice(self.proto_groups if rng.random() < 0.1 else self.proto)
+        res = '{} *{}'.format(lang, self.word())
+        r = rng.random()
+        if r < 0.6:
+            res = '{:<20}{:<10}{}'.format(res, rng.choice(POS), self.gloss())
+        elif r < 0.8:
+            res = "{:<20}`{}'".format(res, rng.choice(GLOSSES)[1])
+        else:
+            res = '{} "{}" = `{}\''.format(res, rng.choice(GLOSSES)[1].upper(), self.word())
+        if rng.random() < 0.1:
+            res += ' [TK 1978 {}a]'.format(rng.randint(1, 20))
+        return [res]
+
+    def witness(self):
+        rng = self.rng
+        res = '     {:<9}{:<30}{:<10}'.format(rng.choice(self.modern), self.word(), rng.choice(POS))
+        if rng.random() < 0.05:  # A gloss continued on a line with 50 space offset.
+            return [res + self.gloss(), 50 * ' ' + self.gloss().replace('//', ',')]
+        res = '{}{:<34}[{}]'.format(res, self.gloss(), rng.choice(SOURCES))
+        if rng.random() < 0.05:
+            return [res, '     [{} {}]'.format('see also', self.word())]
+        return [res]
+
+    def etymon(self):
+        rng = self.rng
+        res = self.protoform()
+        # The real dictionary has about 12.5 reflexes per etymon.
+        for _ in range(rng.randint(1, 24)):
+            res.extend(self.witness())
+        r = rng.random()
+        if r < 0.1:
+            res.extend(['[a comment on the etymon, which', 'is continued on the next line]'])
+        elif r < 0.15:
+            res.append('cf. {:<9}{:<30}{}'.format(rng.choice(self.modern), self.word(), self.gloss()))
+        return res
+
+    def concept(self):
+        name = '        {}'.format(self.rng.choice(GLOSSES)[1].upper())
+        r = self.rng.random()
+        if r < 0.1:
+            name += ' ({})'.format(self.rng.choice(SPECIES))
+        elif r < 0.15:
+            name += ' [introduced after 1500 CE]'
+        return name
+
+    def iter_fixes(self):
+        """
+        Entries containing the text fixed by BLOCKS, SUBSTITUTIONS, LINES and CONTINUATION_LINES.
+
+        Each entry is yielded as list of lines, with multi-line fixes as single items, to make sure
+        they aren't interrupted by page footers. Since fixes are applied to the raw text, lines
+        are written as they appear in the raw text, i.e. before SUBSTITUTIONS are made.
+        """
+        for k in BLOCKS:
+            yield [ETYMA_SEPARATOR, k[:-1]] + self.etymon()
+        if not self.with_fixes:
+            return
+        for k in SUBSTITUTIONS:
+            yield self.protoform() + self.witness() + ['[a comment with {}]'.format(k)]
+        # LINES which would be matched as continuation lines can only be matched once the
+        # continuation lines have been matched, so we append them to the continuation lines.
+        continued = collections.defaultdict(list)
+        for k in LINES:
+            for i, cl in enumerate(CONTINUATION_LINES):
+                if substitute(k).strip() in {line.strip() for line in cl.lines}:
+                    continued[i].append(k)
+                    break
+        for i, cl in enumerate(CONTINUATION_LINES):
+            lines = ['\n'.join(cl.raw_lines)] + [
+                line for k in continued[i] for line in [k] + self.witness()]
+            if cl.lines[0].startswith(' '):  # Continued witness line.
+                yield self.protoform() + lines + self.witness()
+            else:
+                yield lines + self.witness()
+        continued = {k for ks in continued.values() for k in ks}
+        for k in LINES:
+            if k in continued:
+                continue
+            if k.startswith(' ') and not k.lstrip().startswith(('cf.', '[')):  # Witness line.
+                yield self.protoform() + [k] + self.witness()
+            elif k.startswith('[') or ' ' not in k.strip():  # Comments.
+                yield self.protoform() + self.witness() + [k]
+            else:
+                yield [k] + self.witness()
+
+    def iter_items(self):
+        """
+        The body of the dictionary, as list of items, each item being one or more lines.
+        """
+        rng = self.rng
+        fixes = list(self.iter_fixes())
+        nfields = max(1, ETYMA * self.scale // ETYMA_PER_FIELD)
+        for i in range(nfields):
+            yield FRAME
+            yield '%% SEMANTIC FIELD {} %%'.format(i + 1)
+            yield FRAME
+            netyma = 0
+            while netyma < ETYMA_PER_FIELD:
+                if netyma and rng.random() < 0.1:
+                    yield '             % SUBFIELD {}.{} %'.format(i + 1, netyma)
+                yield CONCEPTS_SEPARATOR
+                yield self.concept()
+                yield ''
+                for j in range(rng.randint(1, 6)):
+                    if j:
+                        yield from [ETYMA_SEPARATOR, ''] if rng.random() < 0.5 else ['', '']
+                    yield from self.etymon()
+                    netyma += 1
+                yield ''
+                if fixes and rng.random() < len(fixes) / (nfields * 2):
+                    yield from fixes.pop()
+                    yield ''
+        while fixes:
+            yield from fixes.pop()
+            yield ''
+
+    def iter_lines(self):
+        yield from ['', 'A Preliminary Mayan Etymological Dictionary', '', '    MAYAN ETYMOLOGIES', '']
+        page, lines = 1, 5
+        for item in self.iter_items():
+            yield item
+            lines += item.count('\n') + 1
+            if lines >= LINES_PER_PAGE:
+                yield PAGE_FOOTER.format(page)
+                page, lines = page + 1, 0
+        yield from ['', '                      T H E     E N D', '', PAGE_FOOTER.format(page), '']
+
+    def write(self, p):
+        with pathlib.Path(p).open('w', encoding='utf8') as f:
+            for line in self.iter_lines():
+                f.write(line)
+                f.write('\n')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic PMED text.')
+    parser.add_argument('output')
+    parser.add_argument(
+        '--scale', type=int, default=1, help='Size relative to the real dictionary')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument(
+        '--no-fixes', action='store_true', default=False,
+        help='Do not include the lines fixed by LINES and CONTINUATION_LINES')
+    args = parser.parse_args(args)
+    Corpus(scale=args.scale, seed=args.seed, with_fixes=not args.no_fixes).write(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Tokenizers splitting reflex and protoform lines into their fields.
+
+All regular expressions are compiled once, at import time. The tokenizers only split lines into
+strings - resolving language specifications and parsing glosses is left to `lib.parser`.
+"""
+import re
+import collections
+
+WHITESPACE = re.compile(r'\s')
+MULTISPACE = re.compile(r'\s\s+')
+MULTISPACE_GROUP = re.compile(r'(\s\s+)')
+
+# Reflex lines:
+POS_QUALIFIER = re.compile(r'(?:T|vt|vi|aj)(?:\s*\(?\+|:)')
+POS_QUALIFIER_SLASH = re.compile(r'(?P<pos>T|vt|vi|aj)\s*\(?\+\s*(?P<qual>[a-z]+)\)?\s//')
+POS_QUALIFIER_GLOSS = re.compile(
+    r'(?P<pos>T|vt|vi|aj)\s*\(?\+\s*(?P<qual>[a-z]+)\)?\s(?P<gloss>[a-z])')
+POS_COLON_QUALIFIER = re.compile(
+    r'(?P<pos>T|vt|vi|aj):(?P<qual>[a-z/]+)\s(?P<add>\{.b\'e7}\s)?(?P<gloss>[a-z(])')
+SOURCE = re.compile(r'\s*\[(?P<source>[a-zA-Z0-9\-& ():*,#.?]+)]$')
+COLONIAL_FORM = re.compile(r'#[a-z\-]+\s+/')
+SLASH_MULTISPACE = re.compile(r'//\s\s+')
+
+# Protoform lines:
+APOSTROPHES = [("man's", "man__s"), ("mother's", "mother__s")]
+QUOTED_GLOSS = re.compile(r'"(?P<g1>[^"]+)"(\s*(=\s*)?`(?P<g2>[^\']+)\')?;?')
+EQUALS_GLOSS = re.compile(r' = (?P<g2>[a-z]+( [a-z]+)*)')
+BACKTICK_GLOSS = re.compile(r'`(?P<g>[^\']+)\'(\s+\((?P<spec>[^)]+)\))?')
+PROTOFORM_POS = {
+    "vt", "vi", "vt > passive", "vi < P",
+    "s", "P", "sv", "dir", "num",
+    "aj", "aj < P", "a(P)",
+    "reflexive pronoun"}
+
+# Glosses:
+ETR_ERH = re.compile(r'\s*\[E(TR|RH)(,-?E(TR|RH))*]')
+
+ReflexTokens = collections.namedtuple('ReflexTokens', 'lang form pos gloss source comment')
+ProtoformTokens = collections.namedtuple(
+    'ProtoformTokens', 'lang form pos gloss source comment number')
+
+
+def _normalize_reflex(line):
+    # aj (adv?) temprano [ETR],,EARLY,,
+    line = line.replace("vt (instr)ma", "vt (instr)  ma")
+    if POS_QUALIFIER.search(line):  # Cheap check whether any of the substitutions can match.
+        line = POS_QUALIFIER_SLASH.sub(
+            lambda m: '{} + {}  //'.format(m.group('pos'), m.group('qual')),
+            line)
+        line = POS_QUALIFIER_GLOSS.sub(
+            lambda m: '{} + {}  {}'.format(m.group('pos'), m.group('qual'), m.group('gloss')),
+            line)
+        line = POS_COLON_QUALIFIER.sub(
+            lambda m: '{}:{} {}  {}'.format(
+                m.group('pos'), m.group('qual'), m.group('add') or '', m.group('gloss')),
+            line)
+    return line
+
+
+def tokenize_reflex(line):
+    """
+    Split a (stripped) witness line into language specification, form, PoS, gloss, source and
+    comment.
+    """
+    line = _normalize_reflex(line)
+
+    # The language specification:
+    lang, line = line.split(None, maxsplit=1) if WHITESPACE.search(line) else (line, '')
+
+    # The source:
+    source = SOURCE.search(line)
+    if source:
+        line = line[:source.start()].strip()
+        source = source.group('source')
+
+    if COLONIAL_FORM.match(line):
+        # Normalize whitespace between protoform and remainder.
+        line = '{} {}'.format(*line.split(None, maxsplit=1))
+
+    form, pos, gloss, comment = None, None, None, None
+    comps = MULTISPACE.split(SLASH_MULTISPACE.sub('// ', line))
+    if len(comps) == 3:  # 3 multi-space separated "columns".
+        form, pos, gloss = comps  # We assume these are form, PoS and gloss ...
+        if pos.startswith('/') and pos.endswith('/'):  # ... unless PoS is part of the form ...
+            form += ' {}'.format(pos)
+            pos = None
+        elif pos.startswith('[') and pos.endswith(']'):  # ... or a comment.
+            comment = pos[1:-1].strip()
+            pos = None
+    elif len(comps) == 2:
+        form, gloss = comps
+    elif len(comps) == 1:
+        form = comps[0]
+    else:
+        raise ValueError(line)
+    return ReflexTokens(lang, form, pos, gloss, source, comment)
+
+
+def _replace_apostrophes(s):
+    for k, v in APOSTROPHES:
+        s = s.replace(k, v)
+    return s
+
+
+def _restore_apostrophes(s):
+    for k, v in APOSTROPHES:
+        s = s.replace(v, k)
+    return s
+
+
+def tokenize_protoform(protoform):
+    """
+    Split a reconstruction line into language specification, form, PoS, gloss chunks, source,
+    comment chunks and number.
+    """
+    # The language specification:
+    if protoform.startswith('*') or protoform.startswith('#'):
+        langspec = None
+    elif WHITESPACE.search(protoform):
+        langspec, protoform = protoform.split(None, maxsplit=1)
+    else:
+        langspec, protoform = protoform, None
+
+    comment, gloss, source, number, pos = [], [], None, None, None
+
+    if protoform:
+        protoform = _replace_apostrophes(protoform)
+        # "STUFF" = `stuff';
+        match = QUOTED_GLOSS.search(protoform)
+        if match:
+            gloss.append(match.group('g1'))
+            if match.group('g2'):
+                gloss.append(match.group('g2'))
+            protoform = protoform[:match.start()] + protoform[match.end():]
+            if not match.group('g2'):
+                match = EQUALS_GLOSS.search(protoform)
+                if match:
+                    gloss.append(match.group('g2'))
+                    protoform = protoform[:match.start()] + protoform[match.end():]
+            protoform = protoform.lstrip(' ')
+
+        match = BACKTICK_GLOSS.search(protoform)
+        if match:
+            assert not gloss, protoform
+            gloss.append(match.group('g'))
+            if match.group('spec'):
+                gloss.append(match.group('spec'))
+            protoform = protoform[:match.start()] + protoform[match.end():]
+
+        gloss = [_restore_apostrophes(gl) for gl in gloss]
+        protoform = _restore_apostrophes(protoform)
+
+        while '[' in protoform:
+            protoform, _, inbraces = protoform.partition('[')
+            inbraces, _, rem = inbraces.partition(']')
+            protoform += rem
+            if inbraces in {'1', '2'}:
+                number = inbraces
+                protoform = protoform.rstrip(' ')
+            elif 'TK' in inbraces:
+                assert not source
+                source = inbraces
+            else:
+                comment.append(inbraces)
+
+        pf, ingloss = '', False
+        for s in MULTISPACE_GROUP.split(protoform):
+            if '//' in s:
+                ingloss = True
+            if ingloss:
+                if s.strip():
+                    gloss.append(s.strip())
+            else:
+                pf += s
+        protoform = pf.strip()
+
+        for i, ss in enumerate(MULTISPACE.split(protoform)):
+            if i == 0:
+                protoform = ss
+            elif ss in PROTOFORM_POS:
+                pos = ss
+            else:
+                gloss.append(ss)
+    return ProtoformTokens(langspec, protoform, pos, gloss, source, comment, number)
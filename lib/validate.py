@@ -0,0 +1,104 @@
+"""
+Validation of the dictionary, collecting all anomalies in one pass.
+
+Normally, parsing stops at the first problem with an `AssertionError`. In validation mode, problems
+are recorded as `lib.lines.Anomaly` - with page, line number, offending text and the violated
+rule - and parsing continues, skipping the lines or entries which cannot be parsed. Fixes in the
+tables in `lib.lines` which did not match are reported as anomalies, too.
+
+Line numbers are counted as for `Etymon.line`, i.e. starting with 0.
+
+Usage:
+    python -m lib.validate [--workers N] [--json] PMED_TXT
+"""
+import sys
+import json
+import argparse
+import collections
+import dataclasses
+import concurrent.futures
+
+from .lines import Anomaly, unmatched
+from .parser import Dictionary
+
+
+@dataclasses.dataclass
+class Report:
+    semantic_fields: int = 0
+    etyma: int = 0
+    anomalies: list = dataclasses.field(default_factory=list)
+
+    def counts(self):
+        return collections.Counter(a.rule for a in self.anomalies)
+
+    def asdict(self):
+        return dataclasses.asdict(self)
+
+
+def _validate_field(sf):
+    anomalies = []
+    return len(sf.parse(anomalies)), anomalies
+
+
+def validate(p, workers=None):
+    """
+    :param workers: If specified, semantic fields are parsed in parallel, using a pool of
+        `workers` processes.
+    :return: `Report` instance.
+    """
+    res, hits = Report(), collections.Counter()
+    fields = list(Dictionary.iter_semantic_fields(p, hits=hits, anomalies=res.anomalies))
+    # Unmatched BLOCKS have already been reported as "unmatched-block" by `iter_fixed_blocks`, once
+    # `iter_semantic_fields` consumed the whole text:
+    res.anomalies.extend(
+        Anomaly('unmatched-fix', key, message=table)
+        for table, key in unmatched(hits) if table != 'BLOCKS')
+
+    if workers and workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                _validate_field, fields, chunksize=max(1, len(fields) // (4 * workers))))
+    else:
+        results = map(_validate_field, fields)
+
+    for sf, (etyma, anomalies) in zip(fields, results):
+        for a in anomalies:
+            a.semantic_field = sf.sub or sf.main
+        res.semantic_fields += 1
+        res.etyma += etyma
+        res.anomalies.extend(anomalies)
+    return res
+
+
+def format_anomaly(a):
+    return '{}:{} [{}] {}{}{}'.format(
+        '' if a.page is None else a.page,
+        '' if a.line is None else a.line,
+        a.rule,
+        '{}: '.format(a.semantic_field) if a.semantic_field else '',
+        a.text.strip(),
+        ' ({})'.format(a.message) if a.message and a.text.strip() not in a.message else '')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Collect all parse anomalies of the dictionary.')
+    parser.add_argument('pmed_txt')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', action='store_true', default=False)
+    args = parser.parse_args(args)
+
+    report = validate(args.pmed_txt, workers=args.workers)
+    if args.json:
+        print(json.dumps(report.asdict(), indent=2))
+    else:
+        for a in report.anomalies:
+            print(format_anomaly(a))
+        print('{} anomalies in {} semantic fields with {} etyma'.format(
+            len(report.anomalies), report.semantic_fields, report.etyma))
+        for rule, n in report.counts().most_common():
+            print('{}\t{}'.format(n, rule))
+    return 1 if report.anomalies else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import pytest
+
+from lib.cache import ParseCache
+from lib.parser import Dictionary
+
+
+def _fields(dictionary):
+    return [(sf.main, sf.sub, sf.lines, sf.etyma) for sf in dictionary.semantic_fields]
+
+
+@pytest.fixture
+def corpus(synthetic_corpus, tmp_path):
+    text = synthetic_corpus.read_text(encoding='utf8')
+    p = tmp_path / 'pmed.txt'
+    p.write_text(text, encoding='utf8')
+    return p, text
+
+
+@pytest.fixture
+def cache(corpus, tmp_path):
+    res = ParseCache(tmp_path / 'cache')
+    p, _ = corpus
+    dictionary, hit = res.load(p)
+    assert not hit and res.fields.misses == len(dictionary.semantic_fields) > 100
+    return res
+
+
+def test_cache_hit(corpus, cache):
+    p, _ = corpus
+    dictionary, hit = cache.load(p)
+    assert hit
+    assert _fields(dictionary) == _fields(Dictionary(p))
+
+
+def test_lines_inserted(corpus, cache):
+    p, text = corpus
+    # Insert blank lines before the header of the first semantic field:
+    i = text.index('%% SEMANTIC FIELD')
+    i = text.rindex('\n', 0, text.rindex('\n', 0, i)) + 1
+    p.write_text(text[:i] + '\n\n\n' + text[i:], encoding='utf8')
+
+    dictionary, hit = cache.load(p)
+    assert not hit
+    assert cache.fields.misses == 1
+    assert cache.fields.hits == len(dictionary.semantic_fields) - 1
+    # Page and line numbers of the etyma taken from the cache have been shifted:
+    assert _fields(dictionary) == _fields(Dictionary(p))
+
+
+def test_field_edited(corpus, cache):
+    p, text = corpus
+    fresh = Dictionary(p)
+    sf = fresh.semantic_fields[len(fresh.semantic_fields) // 2]
+    etymon = next(e for e in sf.etyma if e.reflexes and e.reflexes[0].gloss)
+    line = next(
+        line for line, _, lineno in sf.lines
+        if lineno > etymon.line and str(etymon.reflexes[0].gloss.spanish) in line)
+    assert text.count(line) == 1
+    p.write_text(text.replace(line, line.replace(' // ', ' y mas // ', 1)), encoding='utf8')
+
+    dictionary, hit = cache.load(p)
+    assert not hit
+    assert cache.fields.misses == 1
+    assert _fields(dictionary) == _fields(Dictionary(p))
+    assert _fields(dictionary) != _fields(fresh)
@@ -0,0 +1,10 @@
+import pytest
+
+from lib.benchmark import IMPORT_BUDGETS, import_time
+
+
+@pytest.mark.parametrize('module,budget', sorted(IMPORT_BUDGETS.items()))
+def test_import_time(module, budget):
+    ms, stack = import_time(module)
+    assert not stack, 'imports the CLDF-writing stack'
+    assert ms <= budget, '{:.1f}ms'.format(ms)
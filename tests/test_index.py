@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from lib.index import levenshtein, FuzzyIndex
+
+ALPHABET = "abc'7 "
+
+
+def dp_levenshtein(a, b):
+    """
+    Levenshtein distance computed with the textbook dynamic programming algorithm.
+    """
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        prev, row[0] = row[0], i
+        for j, cb in enumerate(b, start=1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+    return row[-1]
+
+
+def random_string(rng, max_length):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+
+def test_levenshtein():
+    rng = random.Random(1)
+    # Bit-parallel implementations are often limited to patterns of up to 64 characters, i.e. to
+    # one machine word, so we make sure to cover longer patterns, too.
+    for max_length in [5, 20, 70, 150]:
+        for _ in range(300):
+            a, b = random_string(rng, max_length), random_string(rng, max_length)
+            assert levenshtein(a, b) == dp_levenshtein(a, b), (a, b)
+
+
+def test_levenshtein_edits():
+    rng = random.Random(2)
+    for _ in range(300):
+        a = random_string(rng, 100)
+        b = list(a)
+        for _ in range(rng.randint(0, 5)):
+            i = rng.randint(0, len(b))
+            op = rng.choice(['insert', 'delete', 'substitute'])
+            if op == 'insert':
+                b.insert(i, rng.choice(ALPHABET))
+            elif b and i < len(b):
+                if op == 'delete':
+                    del b[i]
+                else:
+                    b[i] = rng.choice(ALPHABET)
+        b = ''.join(b)
+        assert levenshtein(a, b) == dp_levenshtein(a, b), (a, b)
+
+
+@pytest.fixture(scope='module')
+def strings():
+    rng = random.Random(3)
+    res = [random_string(rng, 12) for _ in range(500)]
+    # Some duplicates and missing values:
+    return res + res[:50] + [None, '']
+
+
+@pytest.fixture(scope='module')
+def queries(strings):
+    """
+    Queries with the brute-force ranking of all strings, as `(distance, string, positions)`
+    triples, with ties broken by order of first appearance.
+    """
+    rng, positions = random.Random(4), {}
+    for i, s in enumerate(strings):
+        if s:
+            positions.setdefault(s, []).append(i)
+    res = []
+    for _ in range(50):
+        item = rng.choice(list(positions)) if rng.random() < 0.3 else random_string(rng, 14)
+        ranking = sorted((dp_levenshtein(item, s), n, s) for n, s in enumerate(positions))
+        res.append((item, [(d, s, positions[s]) for d, _, s in ranking]))
+    return res
+
+
+@pytest.mark.parametrize('k', [0, 1, 3, 10, 1000])
+@pytest.mark.parametrize('max_distance', [None, 0, 2, 5])
+def test_search(strings, queries, k, max_distance):
+    index = FuzzyIndex(strings)
+    for item, ranking in queries:
+        expected = [r for r in ranking if max_distance is None or r[0] <= max_distance][:k]
+        assert index.search(item, k=k, max_distance=max_distance) == expected, item
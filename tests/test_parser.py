@@ -0,0 +1,16 @@
+import gc
+import pickle
+
+from lib.parser import Gloss, GLOSSES
+
+
+def test_gloss_flyweights():
+    g = Gloss.from_string('casa // house [ETR]')
+    assert Gloss.from_string('casa//house') is g
+    # Unpickled glosses are flyweights, too:
+    assert pickle.loads(pickle.dumps(g)) is g
+    # Glosses which are no longer referenced are dropped from the table:
+    key = (g.spanish, g.english)
+    del g
+    gc.collect()
+    assert key not in GLOSSES
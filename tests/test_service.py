@@ -0,0 +1,118 @@
+import json
+import asyncio
+
+import pytest
+
+from lib.parser import Dictionary
+from lib.service import Backend, Service
+
+TIMEOUT = 10
+
+
+@pytest.fixture(scope='module')
+def backend(synthetic_corpus):
+    return Backend(Dictionary(synthetic_corpus))
+
+
+async def _response(reader):
+    """
+    :return: triple (status code, `dict` of headers, decoded JSON body)
+    """
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin1').split('\r\n')
+    headers = {
+        k.strip().lower(): v.strip()
+        for k, _, v in (line.partition(':') for line in head[1:] if line)}
+    body = await reader.readexactly(int(headers['content-length']))
+    return int(head[0].split()[1]), headers, json.loads(body)
+
+
+def _run(backend, client):
+    """
+    Run coroutine function `client` with the address of a running service.
+    """
+    async def main():
+        service = Service(backend)
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        async with server:
+            # If the service fails to respond, the test fails rather than hangs:
+            return await asyncio.wait_for(
+                client(*server.sockets[0].getsockname()[:2]), timeout=TIMEOUT)
+    return asyncio.run(main())
+
+
+def test_keep_alive(backend):
+    async def client(host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        res = []
+        for path in ['/etymon/1', '/page/1', '/stats']:
+            writer.write('GET {} HTTP/1.1\r\nHost: x\r\n\r\n'.format(path).encode())
+            await writer.drain()
+            res.append(await _response(reader))
+        writer.close()
+        return res
+
+    (s1, h1, etymon), (s2, _, page), (s3, _, stats) = _run(backend, client)
+    assert s1 == s2 == s3 == 200
+    assert h1['connection'] == 'keep-alive'
+    assert etymon == backend.etymon(1)
+    assert page == backend.page(1)[:100]
+    assert stats['etymon']['count'] == 1
+
+
+def test_request_body(backend):
+    async def client(host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        # The body of a GET request is discarded, and the connection is kept alive:
+        writer.write(
+            b'GET /etymon/1 HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello'
+            b'GET /stats HTTP/1.1\r\n\r\n')
+        await writer.drain()
+        res = [await _response(reader), await _response(reader)]
+        # Other methods are not allowed, and the connection is closed:
+        writer.write(b'POST /page/1 HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello')
+        await writer.drain()
+        res.append(await _response(reader))
+        res.append(await reader.read())
+        writer.close()
+        return res
+
+    (s1, _, etymon), (s2, _, _), (s3, h3, _), rest = _run(backend, client)
+    assert (s1, s2, s3) == (200, 200, 405)
+    assert etymon == backend.etymon(1)
+    assert h3['connection'] == 'close'
+    assert rest == b''
+
+
+def test_chunked_body(backend):
+    async def client(host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            b'GET /etymon/1 HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n')
+        await writer.drain()
+        res = await _response(reader), await reader.read()
+        writer.close()
+        return res
+
+    (status, headers, _), rest = _run(backend, client)
+    assert status == 200
+    assert headers['connection'] == 'close'
+    assert rest == b''
+
+
+def test_concurrent_requests(backend):
+    ids = range(1, 51)
+
+    async def request(host, port, etymon_id):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write('GET /etymon/{} HTTP/1.1\r\n\r\n'.format(etymon_id).encode())
+        await writer.drain()
+        res = await _response(reader)
+        writer.close()
+        return res
+
+    async def client(host, port):
+        return await asyncio.gather(*[request(host, port, i) for i in ids])
+
+    for etymon_id, (status, _, etymon) in zip(ids, _run(backend, client)):
+        assert status == 200
+        assert etymon == backend.etymon(etymon_id)
@@ -0,0 +1,290 @@
+"""
+Parity of `lib.tokenizer` - and of `Reflex.from_line` and `Protoform.from_line` built on it - with
+the implementation it replaced, which is kept below as reference.
+"""
+import re
+import random
+import itertools
+
+import pytest
+
+from lib.lines import LINES, CONTINUATION_LINES
+from lib.parser import Gloss, Reflex, Protoform
+from lib.languoids import match_languoids
+from lib.tokenizer import tokenize_reflex, tokenize_protoform
+from lib.benchmark import Inputs
+
+
+def reference_tokenize_reflex(line):
+    line = line.replace("(+ dir)[d]estirar", "(+ dir)[d]estirar")
+    line = line.replace("vt (instr)ma", "vt (instr)  ma")
+
+    linen = re.sub(
+        r'(?P<pos>T|vt|vi|aj)\s*\(?\+\s*(?P<qual>[a-z]+)\)?\s//',
+        lambda m: '{} + {}  //'.format(m.group('pos'), m.group('qual')),
+        line)
+    linen = re.sub(
+        r'(?P<pos>T|vt|vi|aj)\s*\(?\+\s*(?P<qual>[a-z]+)\)?\s(?P<gloss>[a-z])',
+        lambda m: '{} + {}  {}'.format(m.group('pos'), m.group('qual'), m.group('gloss')),
+        linen)
+    linen = re.sub(
+        r'(?P<pos>T|vt|vi|aj):(?P<qual>[a-z/]+)\s(?P<add>\{.b\'e7}\s)?(?P<gloss>[a-z(])',
+        lambda m: '{}:{} {}  {}'.format(
+            m.group('pos'), m.group('qual'), m.group('add') or '', m.group('gloss')),
+        linen)
+    if linen != line:
+        line = linen
+
+    lang, line = line.split(None, maxsplit=1) if re.search(r'\s', line) else (line, '')
+
+    source = re.search(r'\s*\[(?P<source>[a-zA-Z0-9\-& ():*,#.?]+)]$', line)
+    if source:
+        line = line[:source.start()].strip()
+        source = source.group('source')
+
+    if re.match(r'#[a-z\-]+\s+/', line):
+        line = '{} {}'.format(*line.split(None, maxsplit=1))
+
+    form, pos, gloss, comment = None, None, None, None
+    comps = re.split(r'\s\s+', re.sub(r'//\s\s+', '// ', line))
+    if len(comps) == 3:
+        form, pos, gloss = comps
+        if pos.startswith('/') and pos.endswith('/'):
+            form += ' {}'.format(pos)
+            pos = None
+        elif pos.startswith('[') and pos.endswith(']'):
+            comment = pos[1:-1].strip()
+            pos = None
+    elif len(comps) == 2:
+        form, gloss = comps
+    elif len(comps) == 1:
+        form = comps[0]
+    else:
+        raise ValueError(line)
+    return lang, form, pos, gloss, source, comment
+
+
+def reference_tokenize_protoform(protoform):
+    def repl_apos(s):
+        for k, v in [("man's", "man__s"), ("mother's", "mother__s")]:
+            s = s.replace(k, v)
+        return s
+
+    def repl_underscore(s):
+        for k, v in [("man's", "man__s"), ("mother's", "mother__s")]:
+            s = s.replace(v, k)
+        return s
+
+    if protoform.startswith('*') or protoform.startswith('#'):
+        langspec = None
+    elif re.search(r'\s', protoform):
+        langspec, protoform = protoform.split(None, maxsplit=1)
+    else:
+        langspec, protoform = protoform, None
+
+    comment, gloss, source, number, pos = [], [], None, None, None
+
+    if protoform:
+        protoform = repl_apos(protoform)
+        match = re.search(r'"(?P<g1>[^"]+)"(\s*(=\s*)?`(?P<g2>[^\']+)\')?;?', protoform)
+        if match:
+            gloss.append(match.group('g1'))
+            if match.group('g2'):
+                gloss.append(match.group('g2'))
+            protoform = protoform[:match.start()] + protoform[match.end():]
+            if not match.group('g2'):
+                match = re.search(r' = (?P<g2>[a-z]+( [a-z]+)*)', protoform)
+                if match:
+                    gloss.append(match.group('g2'))
+                    protoform = protoform[:match.start()] + protoform[match.end():]
+            protoform = protoform.lstrip(' ')
+
+        match = re.search(r'`(?P<g>[^\']+)\'(\s+\((?P<spec>[^)]+)\))?', protoform)
+        if match:
+            assert not gloss, protoform
+            gloss.append(match.group('g'))
+            if match.group('spec'):
+                gloss.append(match.group('spec'))
+            protoform = protoform[:match.start()] + protoform[match.end():]
+
+        if gloss:
+            gloss = [repl_underscore(gl) for gl in gloss]
+        protoform = repl_underscore(protoform)
+
+        while '[' in protoform:
+            protoform, _, inbraces = protoform.partition('[')
+            inbraces, _, rem = inbraces.partition(']')
+            protoform += rem
+            if inbraces in {'1', '2'}:
+                number = inbraces
+                protoform = protoform.rstrip(' ')
+            elif 'TK' in inbraces:
+                assert not source
+                source = inbraces
+            else:
+                comment.append(inbraces)
+
+        pf, ingloss = '', False
+        for s in re.split(r'(\s\s+)', protoform):
+            if '//' in s:
+                ingloss = True
+            if ingloss:
+                if s.strip():
+                    gloss.append(s.strip())
+            else:
+                pf += s
+        protoform = pf.strip()
+
+        for i, ss in enumerate(re.split(r'\s\s+', protoform)):
+            if i == 0:
+                protoform = ss
+            elif ss in {
+                    "vt", "vi", "vt > passive", "vi < P",
+                    "s", "P", "sv", "dir", "num",
+                    "aj", "aj < P", "a(P)",
+                    "reflexive pronoun"}:
+                pos = ss
+            else:
+                gloss.append(ss)
+    return langspec, protoform, pos, gloss, source, comment, number
+
+
+def reference_gloss(s):
+    s = re.sub(r'\s*\[E(TR|RH)(,-?E(TR|RH))*]', '', s)
+    sp, _, en = s.partition('//')
+    res = Gloss(sp.strip() or None, en.strip() or None)
+    assert (s.strip() == '//') or res.spanish or res.english, s
+    return res
+
+
+def reference_reflex(line):
+    lang, form, pos, gloss, source, comment = reference_tokenize_reflex(line)
+    lang, orig_lang = match_languoids(lang)
+    assert len(lang) == 1, 'reflexes must be assigned to a single variety'
+    return Reflex(
+        lang[0],
+        form=form,
+        gloss=reference_gloss(gloss) if gloss else None,
+        source=source,
+        pos=pos,
+        comment=comment,
+        orig_lang=orig_lang,
+    )
+
+
+def reference_protoform(line):
+    langspec, protoform, pos, gloss, _, comment, number = reference_tokenize_protoform(line)
+    orig = None
+    if langspec:
+        res, orig = match_languoids(langspec)
+        assert res
+        langspec = '+'.join(res)
+    gloss = reference_gloss('; '.join(gloss)) if '; '.join(gloss).strip() else None
+    return Protoform(langspec, protoform, gloss, pos, '; '.join(comment), number, orig_lang=orig)
+
+
+def outcome(func, line):
+    """
+    The result of calling `func`, or - for invalid lines - the fact that an exception was raised.
+    """
+    try:
+        return func(line)
+    except Exception:
+        return Exception
+
+
+# Lines exercising the features of the tokenizers which aren't (reliably) found in the fixed
+# lines or the synthetic corpus:
+EXAMPLES = [
+    "KCH  tzuk  vt (+ dir) // estirar  [tk]",
+    "CHJ kab vt + dir  //  foo",
+    "CHJ kab vt(+dir) tomar",
+    "MAM  x  aj:adv {Xb'e7} foo",
+    "MAM  x  vt:a/b (foo)",
+    "KCH  a  vt (instr)ma",
+    "AWA  #meb'a7 aj/s hue*rfano, pobre //              [a]",
+    "KCH  #ab-c   /x/  s",
+    "KCH  a  /b/  c",
+    "KCH  a  [cmt]  c",
+    "KCH a  b  c  d",
+    "KCH",
+    "pM *man's   `mother's brother' (Foo bar)",
+    'pM "HEAD of X" = `y\'; *a',
+    'pM "X Y" = foo bar; *a  s  gloss // g',
+    "pM *a [1] [TK 1978] [cmt]  vt  to do // hacer  ",
+    "pM *a [2]  s  casa // house",
+    "pM *a [TK] [TK]",
+    "*abc",
+    "#abc  s",
+    "pM",
+    "EM+GQ *a   aj < P  reflexive pronoun",
+    "pM *a  vt > passive  b // c  d  e",
+    "pM *a  vi < P  a(P)  sv  x [ETR] // y [ERH,-ETR]",
+]
+TOKENS = [
+    '//', "`a b'", '"X"', '=', '[1]', '[2]', '[TK]', '[tk]', '[cmt]', 's', 'vt', 'vi', 'aj:x',
+    '(+', 'dir)', '+', '/x/', '#ab', 'reflexive', 'pronoun', '[ETR]']
+
+
+def fixed_lines():
+    for line in LINES.values():
+        yield from line.split('\n')
+    for cl in CONTINUATION_LINES:
+        yield cl.replacement
+
+
+def random_lines(n=5000, seed=1):
+    """
+    Random combinations of the tokens of fixed lines and examples.
+    """
+    rng = random.Random(seed)
+    tokens = sorted(set(
+        TOKENS + [t for line in itertools.chain(fixed_lines(), EXAMPLES) for t in line.split()]))
+    for _ in range(n):
+        yield rng.choice(['pM ', 'KCH  ', '*', 'EM+GQ ', 'MAM ', '']) + ''.join(
+            rng.choice(tokens) + rng.choice([' ', '  ']) for _ in range(rng.randint(1, 8)))
+
+
+@pytest.fixture(scope='module')
+def entry_lines(synthetic_corpus):
+    return Inputs(synthetic_corpus).entry_lines
+
+
+@pytest.mark.parametrize(
+    'func,reference',
+    [
+        (tokenize_reflex, reference_tokenize_reflex),
+        (tokenize_protoform, reference_tokenize_protoform),
+        (Reflex.from_line, reference_reflex),
+        (Protoform.from_line, reference_protoform),
+    ])
+def test_lines(func, reference):
+    for line in itertools.chain(fixed_lines(), EXAMPLES, random_lines()):
+        for line in [line, line.strip()]:
+            assert outcome(func, line) == outcome(reference, line), line
+
+
+@pytest.mark.parametrize(
+    'func,reference',
+    [
+        (tokenize_reflex, reference_tokenize_reflex),
+        (Reflex.from_line, reference_reflex),
+    ])
+def test_witness_lines(entry_lines, func, reference):
+    witnesses, _ = entry_lines
+    assert len(witnesses) > 30000
+    for line in witnesses:
+        assert outcome(func, line) == outcome(reference, line), line
+
+
+@pytest.mark.parametrize(
+    'func,reference',
+    [
+        (tokenize_protoform, reference_tokenize_protoform),
+        (Protoform.from_line, reference_protoform),
+    ])
+def test_protoform_lines(entry_lines, func, reference):
+    _, protoforms = entry_lines
+    assert len(protoforms) > 2000
+    for line in protoforms:
+        assert outcome(func, line) == outcome(reference, line), line
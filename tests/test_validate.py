@@ -0,0 +1,34 @@
+import pytest
+
+from lib.lines import BLOCKS
+from lib.parser import Dictionary
+from lib.validate import validate
+
+BLOCK = next(k for k in BLOCKS if 'OVER' in k)
+
+
+@pytest.fixture
+def corrupted_block(synthetic_corpus, tmp_path):
+    text = synthetic_corpus.read_text(encoding='utf8')
+    assert BLOCK in text
+    p = tmp_path / 'pmed.txt'
+    p.write_text(text.replace(BLOCK, BLOCK.replace('OVER', 'OVRR'), 1), encoding='utf8')
+    return p
+
+
+def test_unmatched_block(corrupted_block):
+    with pytest.raises(AssertionError):
+        Dictionary(corrupted_block)
+
+
+def test_validate_unmatched_block(corrupted_block):
+    report = validate(corrupted_block)
+    assert [a.text for a in report.anomalies if a.rule == 'unmatched-block'] == [BLOCK]
+    assert not [a for a in report.anomalies if a.text == BLOCK and a.rule != 'unmatched-block']
+
+
+def test_validate(synthetic_corpus):
+    # The synthetic corpus contains the text fixed by all fixes in `lib.lines`:
+    report = validate(synthetic_corpus)
+    assert report.etyma > 3000
+    assert not report.anomalies